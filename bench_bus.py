@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Benchmark the host endpoints in main.py against the simulated block farm.
+
+Reports per-endpoint latency and dump goodput, e.g.
+
+    python bench_bus.py --blocks 10 --rounds 5
+    python bench_bus.py --blocks 4 --turnaround-us 500 --dump-bytes 40960
+    python bench_bus.py --blocks 2 --rounds 1 --error-rates 0,0.01,0.05
+    python bench_bus.py --blocks 10 --buses 2
+    python bench_bus.py --blocks 3 --rounds 1 --dump-rates 1500000,2000000,2500000,3000000
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument('--blocks', type=int, default=10, help='number of simulated blocks (1-10)')
+    p.add_argument('--buses', type=int, default=1, help='simulated RS485 ports the blocks are split over')
+    p.add_argument('--rounds', type=int, default=5, help='calls per endpoint')
+    p.add_argument('--baud', type=int, default=1500000, help='simulated line rate')
+    p.add_argument('--turnaround-us', type=int, default=250, help='block delay before each reply frame')
+    p.add_argument('--dump-bytes', type=int, default=5 * 2048 * 16, help='capture size per block')
+    p.add_argument('--error-rates', default='',
+                   help='comma-separated fractions of corrupted reply frames to measure dump goodput under')
+    p.add_argument('--dump-rates', default='',
+                   help='comma-separated DUMP_BAUD values to measure dump goodput at')
+    p.add_argument('--max-baud', type=int, default=0,
+                   help='simulated transceiver limit: frames above it are garbled (0 = none)')
+    p.add_argument('--verbose', action='store_true', help='show the host debug output')
+    return p.parse_args()
+
+
+async def timed(fn, rounds: int, quiet: bool):
+    durations = []
+    result = None
+    for _ in range(rounds):
+        sink = io.StringIO() if quiet else sys.stdout
+        with contextlib.redirect_stdout(sink):
+            start = time.perf_counter()
+            result = await fn()
+            durations.append(time.perf_counter() - start)
+    return durations, result
+
+
+async def report_during_dump(host, rounds: int, quiet: bool):
+    """/rt_report latency while a /dump is in flight: the scheduler should run it between dump steps."""
+    sink = io.StringIO() if quiet else sys.stdout
+    with contextlib.redirect_stdout(sink):
+        dump = asyncio.create_task(host.dump_blocks(force=True))
+        await asyncio.sleep(0.05)
+        durations, _ = await timed(host.get_reports, rounds, quiet)
+        await dump
+    return durations
+
+
+async def goodput_under_errors(host, rates: list[float], rounds: int, quiet: bool):
+    """Dump goodput with the simulator corrupting a fraction of reply frames; verifies every capture."""
+    print(f"\n{'error rate':>10} {'KB/s':>8} {'resent':>8} {'intact':>8}")
+    captures = {block_id: block for farm in host.sim_farms for block_id, block in farm.blocks.items()}
+    for rate in rates:
+        for farm in host.sim_farms:
+            farm.error_rate = rate
+        durations, result = await timed(lambda: host.dump_blocks(force=True), rounds, quiet)
+        results = result["results"] if isinstance(result, dict) else []
+        total_bytes = sum(r["bytes_received"] for r in results)
+        resent = sum(r.get("chunks_resent", 0) for r in results)
+        intact = sum(1 for r in results if r["filename"] and
+                     open(r["filename"], 'rb').read() == captures[r["block_id"]].capture)
+        goodput = total_bytes / statistics.median(durations)
+        print(f"{rate:>10.1%} {goodput / 1024:>8.1f} {resent:>8} {intact:>5}/{len(results)}")
+    for farm in host.sim_farms:
+        farm.error_rate = 0.0
+
+
+async def goodput_per_rate(host, rates: list[int], rounds: int, quiet: bool):
+    """Dump goodput with DUMP_BAUD set to each rate in turn; 'fast' counts blocks that stayed at it."""
+    print(f"\n{'dump baud':>10} {'KB/s':>8} {'% line':>8} {'fast':>6} {'intact':>8}")
+    captures = {block_id: block for farm in host.sim_farms for block_id, block in farm.blocks.items()}
+    default = host.DUMP_BAUD
+    for rate in rates:
+        host.DUMP_BAUD = rate
+        host.baud_fallback.clear()
+        durations, result = await timed(lambda: host.dump_blocks(force=True), rounds, quiet)
+        results = result["results"] if isinstance(result, dict) else []
+        total_bytes = sum(r["bytes_received"] for r in results)
+        fast = sum(1 for r in results if r.get("baud") == rate)
+        intact = sum(1 for r in results if r["filename"] and
+                     open(r["filename"], 'rb').read() == captures[r["block_id"]].capture)
+        goodput = total_bytes / statistics.median(durations)
+        line_rate = len(host.lanes) * max(rate, host.BAUD) / 10
+        print(f"{rate:>10} {goodput / 1024:>8.1f} {100 * goodput / line_rate:>7.1f}% "
+              f"{fast:>3}/{len(results):<2} {intact:>5}/{len(results)}")
+    host.DUMP_BAUD = default
+    host.baud_fallback.clear()
+
+
+def report(name: str, durations: list[float]):
+    ordered = sorted(durations)
+    p95 = ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))]
+    print(f"{name:<12} {len(durations):>6} {ordered[0] * 1000:>10.1f} "
+          f"{statistics.median(ordered) * 1000:>10.1f} {p95 * 1000:>10.1f}")
+
+
+async def run_benchmarks(args):
+    import main as host
+    host.BAUD = args.baud
+    os.chdir(tempfile.mkdtemp(prefix='react_bench_'))  # dumps land here
+
+    quiet = not args.verbose
+    print(f"{args.blocks} simulated blocks on {len(host.lanes)} bus(es) @ {args.baud} baud, "
+          f"turnaround {args.turnaround_us} us, dump {args.dump_bytes} bytes/block")
+    print(f"{'endpoint':<12} {'rounds':>6} {'min ms':>10} {'median ms':>10} {'p95 ms':>10}")
+
+    async with host.lifespan(host.app):
+        durations, _ = await timed(host.ping_all_blocks, args.rounds, quiet)
+        report('/ping', durations)
+        durations, _ = await timed(host.arm, args.rounds, quiet)
+        report('/arm', durations)
+        durations, _ = await timed(host.set, args.rounds, quiet)
+        report('/set', durations)
+        durations, _ = await timed(host.get_reports, args.rounds, quiet)
+        report('/rt_report', durations)
+        durations, _ = await timed(host.get_status, args.rounds, quiet)
+        report('/status', durations)
+        durations, result = await timed(lambda: host.dump_blocks(force=True), args.rounds, quiet)
+        report('/dump', durations)
+        cached, _ = await timed(host.dump_blocks, args.rounds, quiet)
+        report('/dump again', cached)  # nothing ran since: one frame per block
+        during = await report_during_dump(host, args.rounds, quiet)
+        report('rt in dump', during)
+        if args.error_rates:
+            rates = [float(r) for r in args.error_rates.split(',')]
+            await goodput_under_errors(host, rates, args.rounds, quiet)
+        if args.dump_rates:
+            rates = [int(r) for r in args.dump_rates.split(',')]
+            await goodput_per_rate(host, rates, args.rounds, quiet)
+
+    total_bytes = result["summary"]["total_bytes_received"] if isinstance(result, dict) else 0
+    median = statistics.median(durations)
+    goodput = total_bytes / median if median else 0.0
+    line_rate = len(host.lanes) * max(args.baud, host.DUMP_BAUD) / 10  # bytes/s with start and stop bits, all buses
+    print(f"\ndump goodput: {total_bytes} bytes in {median:.2f}s = {goodput / 1024:.1f} KB/s "
+          f"({100 * goodput / line_rate:.1f}% of line rate)")
+    for farm, lane in zip(host.sim_farms, host.lanes):
+        print(f"{lane.name} sim bus stats:", farm.stats)
+        print(f"{lane.name} scheduler:", lane.scheduler.snapshot())
+
+
+def main():
+    args = parse_args()
+    os.environ.update({
+        'REACT_SIM': '1',
+        'REACT_SIM_BLOCKS': str(args.blocks),
+        'REACT_SIM_BUSES': str(args.buses),
+        'REACT_SIM_BAUD': str(args.baud),
+        'REACT_SIM_TURNAROUND_US': str(args.turnaround_us),
+        'REACT_SIM_DUMP_BYTES': str(args.dump_bytes),
+        'REACT_SIM_MAX_BAUD': str(args.max_baud),
+    })
+    sys.path.insert(0, HERE)
+    asyncio.run(run_benchmarks(args))
+
+
+if __name__ == '__main__':
+    main()
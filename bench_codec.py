@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark for the host-side frame decoder: CPU time per MB received.
+
+Pushes a synthetic dump stream through a pty into pyserial and compares the
+old byte-at-a-time STX hunt with codec.FrameDecoder's bulk reads, and the
+same decoder on v2 frames with 2 KB chunks and CRC-16. CPU time is measured
+on the reading thread only.
+
+Then times dump assembly at growing capture sizes: the old `file_data +=
+payload` against codec.DumpAssembler, which should stay flat per MB, and
+frame encoding: encode_frame, the constant-frame cache and FrameBuffer.
+
+Before any timing, randomized round trips check the codec: every frame
+decodes to what was encoded, FrameBuffer matches encode_frame, any single
+flipped bit is rejected, and FrameDecoder recovers every frame from a stream
+split at random points with garbage in between. --check runs only these
+and exits non-zero on the first failure.
+
+    python bench_codec.py --check
+    python bench_codec.py --mb 4
+    python bench_codec.py --mb 1 --error-rate 0.05 --cases 10000
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+import tty
+import serial
+import struct
+import codec
+import command_codes as cmdc
+import checksum as cks
+import builders as bld
+
+CHUNK_SIZE = 255
+DUMP_CHUNK_SIZE = cmdc.DUMP_CHUNK_SIZE
+ASSEMBLY_SIZES = [64 * 1024, 170 * 1024, 512 * 1024, 1024 * 1024, 4 * 1024 * 1024]
+CONCAT_LIMIT = 1024 * 1024  # bytes += is quadratic; don't wait forever on it
+
+
+def make_stream(num_bytes: int, error_rate: float, seed: int = 0, version: int = 1) -> bytes:
+    rng = random.Random(seed)
+    reply = cmdc.reply_cmd(cmdc.CMD_DUMP)
+    chunk_size = CHUNK_SIZE if version == 1 else cmdc.DUMP_CHUNK_SIZE_V2
+    out = bytearray()
+    while len(out) < num_bytes:
+        frame = bytearray(bld.build_frame(1, reply, rng.randbytes(chunk_size), version))
+        if rng.random() < error_rate:
+            frame[rng.randrange(4, len(frame))] ^= 0xFF
+        out += frame
+    return bytes(out)
+
+
+def byte_at_a_time(ser: serial.Serial) -> int:
+    """The pre-decoder read_dump_chunks loop: ser.read(1) until STX, then header/payload/csum."""
+    total = 0
+    while True:
+        b = ser.read(1)
+        if not b:
+            return total
+        if b[0] != cmdc.STX:
+            continue
+        header = ser.read(3)
+        if len(header) < 3:
+            return total
+        payload = ser.read(header[2])
+        csum = ser.read(1)
+        if csum and csum[0] == cks.calc_checksum(bytes([cmdc.STX]) + header + payload):
+            total += len(payload)
+
+
+def bulk_decoder(ser: serial.Serial) -> int:
+    decoder = codec.FrameDecoder()
+    total = 0
+    while decoder.read_from(ser):
+        for _, _, payload in decoder.frames():
+            total += len(payload)
+    return total
+
+
+def run(name: str, fn, stream: bytes):
+    master, slave = os.openpty()
+    tty.setraw(slave)
+    writer = threading.Thread(target=_write_all, args=(master, stream), daemon=True)
+    with serial.Serial(os.ttyname(slave), 1500000, timeout=0.05) as ser:
+        writer.start()
+        start = time.thread_time()
+        payload_bytes = fn(ser)
+        cpu = time.thread_time() - start
+    writer.join()
+    os.close(master)
+    os.close(slave)
+    mb = len(stream) / (1024 * 1024)
+    print(f"{name:<16} {cpu / mb * 1000:>10.1f} {payload_bytes:>12}")
+
+
+def _write_all(fd: int, data: bytes):
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view[:4096]):]
+
+
+def random_frame(rng: random.Random, version: int):
+    max_payload = 255 if version == 1 else cmdc.V2_MAX_PAYLOAD
+    length = rng.choice([0, 1, max_payload, rng.randrange(max_payload + 1)])
+    return rng.randrange(256), rng.randrange(256), rng.randbytes(length)
+
+
+def check_roundtrip(cases: int, seed: int = 0):
+    """Property checks over random frames; raises AssertionError with the failing case."""
+    rng = random.Random(seed)
+    buffers = {v: codec.FrameBuffer(cmdc.V2_MAX_PAYLOAD if v == 2 else 255, v) for v in (1, 2)}
+    sent = []
+    stream = bytearray()
+    for _ in range(cases):
+        version = rng.choice((1, 2))
+        block_id, cmd, payload = random_frame(rng, version)
+        frame = codec.encode_frame(block_id, cmd, payload, version)
+        case = (block_id, cmd, len(payload), version)
+        assert codec.decode_frame(frame) == (block_id, cmd, payload, version), case
+
+        fb = buffers[version]
+        fb.payload[:len(payload)] = payload
+        assert bytes(fb.finish(block_id, cmd, len(payload))) == frame, case
+
+        bad = bytearray(frame)
+        bad[rng.randrange(len(bad))] ^= 1 << rng.randrange(8)
+        assert codec.decode_frame(bytes(bad)) is None, case
+
+        # garbage between frames, without start bytes so every frame must come back
+        stream += bytes(b for b in rng.randbytes(rng.randrange(4)) if b not in (cmdc.STX, cmdc.STX2))
+        stream += frame
+        sent.append((block_id, cmd, payload, version))
+
+    decoder = codec.FrameDecoder()
+    received = []
+    pos = 0
+    while pos < len(stream):
+        step = rng.randrange(1, 600)
+        decoder.feed(stream[pos:pos + step])
+        pos += step
+        received += [(b, c, p, decoder.version) for b, c, p in decoder.frames()]
+    assert received == sent, f"decoded {len(received)} of {len(sent)} frames"
+    print(f"round trip: {cases} random frames ok")
+
+
+def encode_rate(fn, count: int) -> float:
+    start = time.process_time()
+    for _ in range(count):
+        fn()
+    return count / (time.process_time() - start)
+
+
+def bench_encode(count: int = 20000):
+    rng = random.Random(2)
+    payload = rng.randbytes(cmdc.DUMP_SEQ_LEN + cmdc.DUMP_CHUNK_SIZE_V2)
+    fb = codec.FrameBuffer(len(payload), 2)
+    fb.payload[:] = payload
+    reply = cmdc.reply_cmd(cmdc.CMD_DUMP)
+    print(f"\n{'encode':<28} {'frames/s':>12}")
+    rows = [
+        ('ping, encode_frame', lambda: codec.encode_frame(3, cmdc.CMD_PING)),
+        ('ping, constant_frame', lambda: codec.constant_frame(3, cmdc.CMD_PING)),
+        ('2 KB v2 chunk, encode_frame', lambda: codec.encode_frame(3, reply, payload, 2)),
+        ('2 KB v2 chunk, FrameBuffer', lambda: fb.finish(3, reply, len(payload))),
+    ]
+    for name, fn in rows:
+        print(f"{name:<28} {encode_rate(fn, count):>12,.0f}")
+
+
+def assemble_concat(chunks: list[bytes], total: int) -> int:
+    file_data = b''
+    for payload in chunks:
+        file_data += payload[cmdc.DUMP_SEQ_LEN:]
+    return len(file_data)
+
+
+def assemble_prealloc(chunks: list[bytes], total: int) -> int:
+    assembler = codec.DumpAssembler()
+    assembler.expect(struct.pack(cmdc.DUMP_INFO_FMT, total, DUMP_CHUNK_SIZE))
+    for payload in chunks:
+        assembler.add(payload)
+    return len(assembler.data())
+
+
+def assembly_cpu(fn, chunks: list[bytes], total: int) -> float:
+    start = time.process_time()
+    assert fn(chunks, total) == total
+    return (time.process_time() - start) / (total / (1024 * 1024)) * 1000
+
+
+def bench_assembly():
+    print(f"\n{'capture':>10} {'+= ms/MB':>10} {'prealloc ms/MB':>15}")
+    rng = random.Random(1)
+    for total in ASSEMBLY_SIZES:
+        data = rng.randbytes(total)
+        chunks = [struct.pack(cmdc.DUMP_SEQ_FMT, seq) + data[i:i + DUMP_CHUNK_SIZE]
+                  for seq, i in enumerate(range(0, total, DUMP_CHUNK_SIZE))]
+        concat = f"{assembly_cpu(assemble_concat, chunks, total):.1f}" if total <= CONCAT_LIMIT else '-'
+        prealloc = assembly_cpu(assemble_prealloc, chunks, total)
+        print(f"{total // 1024:>8}KB {concat:>10} {prealloc:>15.1f}")
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument('--mb', type=float, default=4.0, help='megabytes of dump traffic to decode')
+    p.add_argument('--error-rate', type=float, default=0.0, help='fraction of frames to corrupt')
+    p.add_argument('--cases', type=int, default=2000, help='random frames for the round-trip checks')
+    p.add_argument('--check', action='store_true', help='run the round-trip checks only, no timing')
+    args = p.parse_args()
+
+    try:
+        check_roundtrip(args.cases)
+    except AssertionError as e:
+        print(f"round trip FAILED: {e}")
+        sys.exit(1)
+    if args.check:
+        return
+
+    stream = make_stream(int(args.mb * 1024 * 1024), args.error_rate)
+    print(f"{len(stream)} bytes, {args.error_rate:.1%} corrupted frames")
+    print(f"{'decoder':<16} {'CPU ms/MB':>10} {'payload B':>12}")
+    run('byte-at-a-time', byte_at_a_time, stream)
+    run('FrameDecoder', bulk_decoder, stream)
+    run('FrameDecoder v2', bulk_decoder, make_stream(len(stream), args.error_rate, version=2))
+    bench_assembly()
+    bench_encode()
+
+
+if __name__ == '__main__':
+    main()
@@ -45,6 +45,7 @@ fifo_ready = False
 
 ts_last = None
 ts_rollovers = 0
+lost_pkt_total = 0  # IMU FIFO packets lost in the last run, read at its end
 
 
 ## FIFO THRESHOLD INTERRUPT PIN
@@ -203,7 +204,7 @@ def get_count():
     return (count_hi << 8) | count_lo
 
 def setup(sensor_type, gender):
-    global gun_timestamp, runner_started_ts, accel_threshold, int_counter, ts_rollovers, gun_fired_internal_ts
+    global gun_timestamp, runner_started_ts, accel_threshold, int_counter, ts_rollovers, gun_fired_internal_ts, lost_pkt_total
     machine.freq(200000000)
     set_sensor_type(sensor_type)
     if gender == 'M':
@@ -217,6 +218,7 @@ def setup(sensor_type, gender):
     fs_alert.value(0)
     int_counter = 0
     ts_rollovers = 0
+    lost_pkt_total = 0
     create_buffer()
     imu.reset()
     imu.write_reg(0x4F, 0b00000101) # GYRO_CONFIG0: FS_SEL=000, ODR=0101 
@@ -262,7 +264,7 @@ def make_timestamp_packet(type, ts):
 
 def start_loop():
     print('starting loop')
-    global wp, fifo_ready, gun_triggered, gun_timestamp, int_counter, ts_rollovers, runner_started_ts, gun_fired_internal_ts
+    global wp, fifo_ready, gun_triggered, gun_timestamp, int_counter, ts_rollovers, runner_started_ts, gun_fired_internal_ts, lost_pkt_total
     logger_running.value(1)
     imu.write_reg(0x4E, 0b00000011)
     start = time.ticks_ms()
@@ -0,0 +1,352 @@
+"""
+Frame codec for the RS485 protocol: v1 [STX][block_id][cmd][len][payload][csum]
+and v2 [STX2][block_id][cmd][len16][hdr sum][payload][crc16] (see command_codes).
+
+Shared by the host and the block firmware (poe bmp copies it to block/lib), so
+everything here must import under MicroPython too. FrameDecoder and
+DumpAssembler are only used on the host.
+"""
+import struct
+import checksum as cks
+import command_codes as cmdc
+
+HEADER_LEN = 4  # STX, block_id, cmd, len
+FRAME_OVERHEAD = HEADER_LEN + 1  # header + checksum
+FRAME_OVERHEAD_V2 = cmdc.V2_HEADER_LEN + 2  # header + CRC-16
+_STX = bytes([cmdc.STX])
+_STX2 = bytes([cmdc.STX2])
+
+
+def encode_frame(block_id: int, cmd: int, payload: bytes = b'', version: int = 1) -> bytes:
+    """Frame a payload as v1 (sum8, up to 255 bytes) or v2 (16-bit length, CRC-16)."""
+    if version >= 2:
+        n = len(payload)
+        header = bytes([cmdc.STX2, block_id, cmd, n >> 8, n & 0xFF])
+        packet = header + bytes([cks.calc_checksum(header)]) + payload
+        crc = cks.calc_crc16(packet)
+        return packet + bytes([crc >> 8, crc & 0xFF])
+    packet = bytes([cmdc.STX, block_id, cmd, len(payload)]) + payload
+    return packet + bytes([cks.calc_checksum(packet)])
+
+
+# CMD_ECHO data: a byte ramp long enough for any start and the largest payload
+_ECHO_RAMP = bytes(range(256)) * ((cmdc.V2_MAX_PAYLOAD + 2 * 256 - 1) // 256)
+
+
+def echo_pattern(seq: int, size: int) -> bytes:
+    """The size bytes a block sends back for CMD_ECHO seq: a ramp from seq & 0xFF, checkable byte by byte."""
+    start = seq & 0xFF
+    return _ECHO_RAMP[start:start + size]
+
+
+_constant_frames = {}
+
+
+def constant_frame(block_id: int, cmd: int, payload: bytes = b'', version: int = 1) -> bytes:
+    """encode_frame() for frames that never change (ping, arm, acks...), built once and reused."""
+    key = (block_id, cmd, payload, version)
+    frame = _constant_frames.get(key)
+    if frame is None:
+        frame = _constant_frames[key] = encode_frame(block_id, cmd, payload, version)
+    return frame
+
+
+def v2_payload_length(header) -> int:
+    """Payload length from a 6-byte v2 header, or -1 if the header fails its own check."""
+    length = header[3] << 8 | header[4]
+    if (header[0] + header[1] + header[2] + header[3] + header[4]) & 0xFF != header[5]:
+        return -1
+    return length if length <= cmdc.V2_MAX_PAYLOAD else -1
+
+
+def decode_frame(frame: bytes):
+    """Check one complete frame; returns (block_id, cmd, payload, version) or None."""
+    if len(frame) >= FRAME_OVERHEAD_V2 and frame[0] == cmdc.STX2:
+        length = v2_payload_length(frame)
+        stop = cmdc.V2_HEADER_LEN + length
+        if length < 0 or len(frame) != stop + 2:
+            return None
+        if cks.calc_crc16(frame[:stop]) != frame[stop] << 8 | frame[stop + 1]:
+            return None
+        return frame[1], frame[2], frame[cmdc.V2_HEADER_LEN:stop], 2
+    if len(frame) >= FRAME_OVERHEAD and frame[0] == cmdc.STX:
+        stop = HEADER_LEN + frame[3]
+        if len(frame) != stop + 1 or cks.calc_checksum(frame[:stop]) != frame[stop]:
+            return None
+        return frame[1], frame[2], frame[HEADER_LEN:stop], 1
+    return None
+
+
+class FrameBuffer:
+    """
+    One preallocated frame whose payload is written in place, e.g. dump chunks
+    read straight from a file with readinto(), so sending a stream of frames
+    allocates nothing per frame.
+
+        fb = FrameBuffer(2 + chunk_size, version)
+        n = f.readinto(fb.payload[2:])
+        uart.write(fb.finish(block_id, cmd, 2 + n))
+    """
+
+    def __init__(self, max_payload: int, version: int = 1):
+        self.version = version
+        self.header_len = cmdc.V2_HEADER_LEN if version >= 2 else HEADER_LEN
+        self.buf = bytearray(self.header_len + max_payload + (2 if version >= 2 else 1))
+        self._view = memoryview(self.buf)
+        self.payload = self._view[self.header_len:self.header_len + max_payload]
+
+    def finish(self, block_id: int, cmd: int, length: int):
+        """Fill in header and checksum around the first `length` payload bytes; returns the frame."""
+        buf = self.buf
+        end = self.header_len + length
+        buf[1] = block_id
+        buf[2] = cmd
+        if self.version >= 2:
+            buf[0] = cmdc.STX2
+            buf[3] = length >> 8
+            buf[4] = length & 0xFF
+            buf[5] = (buf[0] + block_id + cmd + buf[3] + buf[4]) & 0xFF
+            crc = cks.calc_crc16(self._view[:end])
+            buf[end] = crc >> 8
+            buf[end + 1] = crc & 0xFF
+            return self._view[:end + 2]
+        buf[0] = cmdc.STX
+        buf[3] = length
+        buf[end] = cks.calc_checksum(self._view[:end])
+        return self._view[:end + 1]
+
+
+class FrameDecoder:
+    """
+    Incremental frame decoder over a rolling receive buffer.
+
+    Feed it raw bytes as they arrive (or let read_from() pull them from a serial
+    port in one call) and iterate frames() for every complete frame whose
+    checksum validates, v1 and v2 alike; `version` is that of the frame last
+    yielded. Garbage between frames is skipped; after a bad checksum the
+    decoder resyncs on the next start byte after the bad frame's own. A v2
+    header that fails its own check is dropped at once, so a stray STX2 in
+    noise never makes the decoder wait for a bogus 16-bit length.
+    """
+
+    def __init__(self):
+        self._buf = bytearray()
+        self._pos = 0
+        self.version = 1
+        self.frames_ok = 0
+        self.bad_checksums = 0
+        self.skipped_bytes = 0
+
+    def feed(self, data: bytes):
+        if self._pos:
+            del self._buf[:self._pos]
+            self._pos = 0
+        self._buf += data
+
+    def read_from(self, ser) -> int:
+        """
+        Pull whatever the port holds in one read; if nothing is waiting, block
+        for the first byte up to ser.timeout. Returns the number of bytes read.
+        """
+        data = ser.read(ser.in_waiting or 1)
+        if data:
+            self.feed(data)
+        return len(data)
+
+    def frames(self):
+        """Yield (block_id, cmd, payload) for each complete valid frame buffered."""
+        buf = self._buf
+        while True:
+            end = len(buf)
+            start = buf.find(_STX, self._pos)
+            # only look for a v2 start before the next v1 one
+            start2 = buf.find(_STX2, self._pos, start if start >= 0 else end)
+            if start2 >= 0:
+                start = start2
+            if start < 0:
+                self.skipped_bytes += end - self._pos
+                self._pos = end
+                return
+            self.skipped_bytes += start - self._pos
+            self._pos = start
+            if buf[start] == cmdc.STX2:
+                if start + cmdc.V2_HEADER_LEN > end:
+                    return
+                header = bytes(buf[start:start + cmdc.V2_HEADER_LEN])
+                length = v2_payload_length(header)
+                if length < 0:
+                    self.skipped_bytes += 1
+                    self._pos = start + 1  # not a frame start
+                    continue
+                stop = start + cmdc.V2_HEADER_LEN + length
+                if stop + 2 > end:
+                    return  # wait for the rest of the payload and CRC
+                payload = bytes(buf[start + cmdc.V2_HEADER_LEN:stop])
+                ok = cks.calc_crc16(payload, cks.calc_crc16(header)) == buf[stop] << 8 | buf[stop + 1]
+                next_pos, version = stop + 2, 2
+            else:
+                if start + HEADER_LEN > end:
+                    return
+                stop = start + HEADER_LEN + buf[start + 3]
+                if stop >= end:
+                    return  # wait for the rest of the payload and checksum
+                payload = bytes(buf[start + HEADER_LEN:stop])
+                header_sum = cmdc.STX + buf[start + 1] + buf[start + 2] + buf[start + 3]
+                ok = (header_sum + sum(payload)) & 0xFF == buf[stop]
+                next_pos, version = stop + 1, 1
+            if not ok:
+                self.bad_checksums += 1
+                self._pos = start + 1  # resync on the next start byte
+                continue
+            self._pos = next_pos
+            self.frames_ok += 1
+            self.version = version
+            yield buf[start + 1], buf[start + 2], payload
+
+    def pending(self) -> int:
+        """Bytes buffered but not yet consumed as frames."""
+        return len(self._buf) - self._pos
+
+    def clear(self):
+        del self._buf[:]
+        self._pos = 0
+
+
+class DumpAssembler:
+    """
+    Reassembles sequence-numbered dump chunks into a single buffer.
+
+    Once the block has announced the capture and chunk sizes (CMD_DUMP_INFO)
+    the buffer is allocated once and every chunk is copied straight to its
+    offset, so host CPU per byte stays flat however big the capture is.
+    Chunks may arrive in any order or more than once; missing_ranges() lists
+    what still has to be asked for again. Without an announcement the buffer
+    grows to fit.
+
+    With accept_unsequenced, chunks that arrive before any announcement are
+    taken as firmware from before sequenced chunks: raw data, appended in
+    arrival order (`unsequenced` is then set, and there is nothing to ask
+    for again). `tag` is the (run id, CRC32) the block announced, if any,
+    and gun_timestamp / rt_timestamp the run's RTC timestamps (None if the
+    block saw none or didn't say); `unchanged` is set when the block answered
+    that the host's copy is current.
+    """
+
+    def __init__(self, chunk_size: int = cmdc.DUMP_CHUNK_SIZE, accept_unsequenced: bool = False):
+        self.chunk_size = chunk_size
+        self.accept_unsequenced = accept_unsequenced
+        self.unsequenced = False  # the chunks carry no sequence numbers
+        self.expected = None  # total bytes, once announced
+        self.chunk_count = None
+        self.tag = None
+        self.gun_timestamp = None
+        self.rt_timestamp = None
+        self.unchanged = False
+        self.size = 0  # furthest byte written so far
+        self.received_bytes = 0
+        self.duplicates = 0
+        # retransmission bookkeeping, kept by whoever drives the transfer
+        self.resend_rounds = 0
+        self.chunks_requested = 0
+        self._buf = bytearray()
+        self._view = memoryview(self._buf)
+        self._have = bytearray()  # 1 per chunk received
+
+    def expect(self, info_payload: bytes):
+        """Preallocate from a CMD_DUMP_INFO payload."""
+        if self.unsequenced:
+            return  # raw chunks already went in by arrival order
+        total, chunk_size = struct.unpack_from(cmdc.DUMP_INFO_FMT, info_payload)
+        offset = cmdc.DUMP_INFO_LEN
+        if len(info_payload) >= offset + cmdc.DUMP_TAG_LEN:  # firmware before run tags sends none
+            self.tag = struct.unpack_from(cmdc.DUMP_TAG_FMT, info_payload, offset)
+        offset += cmdc.DUMP_TAG_LEN
+        chunk_count = None
+        if len(info_payload) >= offset + cmdc.DUMP_RUN_LEN:
+            chunk_count, gun, rt = struct.unpack_from(cmdc.DUMP_RUN_FMT, info_payload, offset)
+            self.gun_timestamp = gun or None
+            self.rt_timestamp = rt or None
+        if not self.received_bytes:
+            self.chunk_size = chunk_size
+            self._view.release()
+            self._buf = bytearray(total)
+            self._view = memoryview(self._buf)
+        self.expected = total
+        self.chunk_count = chunk_count or (total + self.chunk_size - 1) // self.chunk_size
+        self._track(self.chunk_count)
+
+    def add(self, payload: bytes) -> bool:
+        """
+        Place one chunk (u16 sequence number + data), or append it for an
+        unsequenced stream. Returns False for a duplicate or a chunk too short
+        to hold a sequence number.
+        """
+        if self.unsequenced or (self.accept_unsequenced and self.expected is None):
+            return self._append(payload)
+        if len(payload) <= cmdc.DUMP_SEQ_LEN:
+            return False
+        (seq,) = struct.unpack_from(cmdc.DUMP_SEQ_FMT, payload)
+        self._track(seq + 1)
+        if self._have[seq]:
+            self.duplicates += 1
+            return False
+        data = memoryview(payload)[cmdc.DUMP_SEQ_LEN:]
+        offset = seq * self.chunk_size
+        end = offset + len(data)
+        if end > len(self._buf):
+            self._grow(end)
+        self._view[offset:end] = data
+        self._have[seq] = 1
+        self.received_bytes += len(data)
+        self.size = max(self.size, end)
+        return True
+
+    def _append(self, data: bytes) -> bool:
+        self.unsequenced = True
+        end = self.size + len(data)
+        if end > len(self._buf):
+            self._grow(end)
+        self._view[self.size:end] = data
+        self.received_bytes += len(data)
+        self.size = end
+        return True
+
+    def _track(self, chunks: int):
+        if chunks > len(self._have):
+            self._have += bytes(chunks - len(self._have))
+
+    def _grow(self, end: int):
+        self._view.release()
+        self._buf += bytes(max(end, 2 * len(self._buf)) - len(self._buf))
+        self._view = memoryview(self._buf)
+
+    @property
+    def complete(self) -> bool:
+        return self.expected is not None and self.received_bytes == self.expected
+
+    @property
+    def progress(self) -> float:
+        """Percent of the announced capture received so far (0 before the announcement)."""
+        if self.expected is None:
+            return 0.0
+        return 100.0 * self.received_bytes / self.expected if self.expected else 100.0
+
+    def missing_ranges(self) -> list[tuple[int, int]]:
+        """(first seq, count) runs of chunks not yet received, up to the announced end (or the last chunk seen)."""
+        known = self.chunk_count if self.chunk_count is not None else len(self._have)
+        have = self._have
+        ranges = []
+        seq = have.find(0, 0, known)
+        while seq >= 0:
+            end = have.find(1, seq, known)
+            if end < 0:
+                end = known
+            ranges.append((seq, end - seq))
+            seq = have.find(0, end, known)
+        return ranges
+
+    def data(self) -> bytearray:
+        """The assembled capture; holes left by missing chunks read as zeros."""
+        self._view.release()
+        del self._buf[self.expected if self.expected is not None else self.size:]
+        return self._buf
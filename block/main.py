@@ -1,7 +1,12 @@
 from machine import Pin, UART
+import binascii
+import gc
+import os
+import struct
 import time
 import fifo_comms
 import lib.command_codes as cmdc
+import lib.codec as codec
 
 # --- DEBUG LOGGING ---
 def debug_log(message):
@@ -36,6 +41,7 @@ if BLOCK_ID > 10:
 
 
 BAUD = 1500000
+TXBUF = 1024  # a few dump frames queued, so flash reads overlap the wire
 
 
 TX_PIN = 0
@@ -45,10 +51,14 @@ DIR_PIN = 2
 BOOT_LIGHT = Pin(3, Pin.OUT)
 
 # --- UART and GPIO Setup ---
-uart = UART(0, baudrate=BAUD, tx=Pin(TX_PIN), rx=Pin(RX_PIN))
+uart = UART(0, baudrate=BAUD, tx=Pin(TX_PIN), rx=Pin(RX_PIN), txbuf=TXBUF)
 rts = Pin(DIR_PIN, Pin.OUT)
 rts.value(0)
 
+uart_rate = BAUD  # raised by CMD_BAUD for a dump, back to BAUD after it
+baud_revert_ms = 0  # silence after which a raised rate drops back to BAUD
+last_rx_ms = time.ticks_ms()
+
 
 gun_sensor_type = 'NC'  # Can be 'NC' or 'NO'
 current_gender = None
@@ -56,110 +66,306 @@ current_gender = None
 gun_timestamp = None
 rt_timestamp = None
 
-# --- Low-Level Functions ---
+CAPTURE_FILE = "overall_buffer.bin"
+RUN_ID_FILE = "run_id.txt"
 
-def calc_checksum(data: bytes) -> int:
-    return sum(data) % 256
 
+def load_run_id():
+    try:
+        with open(RUN_ID_FILE) as f:
+            return int(f.read())
+    except Exception:
+        return 0
 
-def send(data: bytes):
+
+def capture_size():
+    try:
+        return os.stat(CAPTURE_FILE)[6]
+    except OSError:
+        return 0
+
+
+run_id = load_run_id()  # bumped by every run, kept across reboots like the capture itself
+capture_crc = None  # CRC32 of CAPTURE_FILE for run_id, worked out on the first dump
+capture_bytes = capture_size()  # kept here so a status reply never waits on flash
+block_state = cmdc.STATE_IDLE
+
+# --- Low-Level Functions ---
+
+def tx_begin():
     time.sleep_us(250)
     rts.value(1)
-    uart.write(data)
+
+
+def tx_end():
     while not uart.txdone():
         pass
     rts.value(0)
 
 
-def send_ack(cmd_code: int):
-    packet = bytes([cmdc.STX, BLOCK_ID, cmdc.reply_cmd(cmd_code), 0])  # No payload
-    packet += bytes([calc_checksum(packet)])
+def send(data: bytes):
+    tx_begin()
+    uart.write(data)
+    tx_end()
+
+
+def send_in_slot(data: bytes, rx_ticks: int, base_us: int = 0):
+    # Broadcast replies wait for this block's slot, counted from when the request arrived
+    slot_start = base_us + (BLOCK_ID - 1) * cmdc.BROADCAST_SLOT_US
+    while time.ticks_diff(time.ticks_us(), rx_ticks) < slot_start:
+        pass
+    send(data)
+
+
+def build_ack(cmd_code: int, version: int = 1) -> bytes:
+    return codec.constant_frame(BLOCK_ID, cmdc.reply_cmd(cmd_code), b'', version)  # No payload
+
+
+def send_ack(cmd_code: int, version: int = 1):
+    packet = build_ack(cmd_code, version)
     print(packet)
     send(packet)
 
 
+def reply_ack(cmd_code: int, is_broadcast: bool, rx_ticks: int, base_us: int = 0):
+    if is_broadcast:
+        send_in_slot(build_ack(cmd_code), rx_ticks, base_us)
+    else:
+        send_ack(cmd_code)
+
+
 def read_packet(timeout_ms=100):
+    """Returns (block_id, cmd, payload, frame version) or None."""
     start = time.ticks_ms()
     while time.ticks_diff(time.ticks_ms(), start) < timeout_ms:
         if uart.any():
             #print(uart.read())
-            if uart.read(1) == b'\xAA':  # Start-of-frame
+            sof = uart.read(1)
+            if sof == b'\xAA':  # Start-of-frame
                 header = uart.read(3)  # block_id, cmd, length
                 if not header or len(header) < 3:
                     continue
-                block_id, cmd, length = header
-                payload = uart.read(length) or b''
-                checksum = uart.read(1)
-                full_packet = bytes([cmdc.STX]) + header + (payload or b'')
-                if checksum and checksum[0] == calc_checksum(full_packet):
-                    return block_id, cmd, payload
+                frame = sof + header + (uart.read(header[2] + 1) or b'')  # payload, checksum
+            elif sof == b'\xAB':  # v2 start-of-frame
+                header = uart.read(5)  # block_id, cmd, length hi, length lo, header sum
+                if not header or len(header) < 5:
+                    continue
+                header = sof + header
+                length = codec.v2_payload_length(header)
+                if length < 0:
+                    continue
+                frame = header + (uart.read(length + 2) or b'')  # payload, CRC
+            else:
+                continue
+            result = codec.decode_frame(frame)
+            if result:
+                return result
     return None
 
 # --- Command Handlers ---
 
 
-def handle_ping(is_broadcast: bool):
+def handle_ping(is_broadcast: bool, rx_ticks: int):
     debug_log("PING received")
     print("PING received")
-    if not is_broadcast:
-        send_ack(cmdc.CMD_PING)
+    reply_ack(cmdc.CMD_PING, is_broadcast, rx_ticks)  # broadcast = discovery
 
 
-def handle_arm(is_broadcast: bool):
-    global gun_sensor_type, current_gender
+def handle_arm(is_broadcast: bool, rx_ticks: int):
+    global gun_sensor_type, current_gender, block_state
     print('gun sensor:', gun_sensor_type)
     print('current gender', current_gender)
+    # Ack first: setup takes longer than any slot, and requests meanwhile wait in the UART
+    reply_ack(cmdc.CMD_ARM, is_broadcast, rx_ticks)
     fifo_comms.setup(gun_sensor_type, current_gender)
-    send_ack(cmdc.CMD_ARM)
+    block_state = cmdc.STATE_ARMED
 
 
 def handle_set(is_broadcast: bool):
-    global gun_timestamp, rt_timestamp
+    global gun_timestamp, rt_timestamp, block_state
     gun_timestamp = None
     rt_timestamp = None
+    block_state = cmdc.STATE_LOGGING
     gun_timestamp, rt_timestamp = fifo_comms.start_loop()
+    new_run()
+    block_state = cmdc.STATE_FINISHED
+    # The host pings during the run to see when it's over; answer only what comes after
+    while uart.any():
+        uart.read()
+
+
+def new_run():
+    global run_id, capture_crc, capture_bytes
+    run_id += 1
+    capture_crc = None
+    capture_bytes = capture_size()
+    try:
+        with open(RUN_ID_FILE, "w") as f:
+            f.write(str(run_id))
+    except Exception as e:
+        debug_log(f"ERROR saving run id: {e}")
 
 
-def handle_dump(is_broadcast: bool):
+def capture_tag(filepath=CAPTURE_FILE):
+    """(run id, CRC32 of the capture file) for dump requests."""
+    global capture_crc
+    if capture_crc is None:
+        crc = 0
+        buf = bytearray(4096)
+        with open(filepath, "rb") as f:
+            while True:
+                n = f.readinto(buf)
+                if not n:
+                    break
+                crc = binascii.crc32(memoryview(buf)[:n], crc)
+        capture_crc = crc
+    return run_id, capture_crc
+
+
+def set_uart_rate(rate: int):
+    global uart_rate
+    uart.init(baudrate=rate, tx=Pin(TX_PIN), rx=Pin(RX_PIN), txbuf=TXBUF)
+    uart_rate = rate
+
+
+def handle_baud(payload: bytes, version: int):
+    # Ack at the rate the host asked on, then follow it to the new one
+    global baud_revert_ms
+    if len(payload) != cmdc.BAUD_LEN:
+        debug_log(f"Invalid BAUD payload ({len(payload)} bytes)")
+        return  # no ack: the host's ping at the new rate fails and it carries on at BAUD
+    rate, revert_ms = struct.unpack(cmdc.BAUD_FMT, payload)
+    send_ack(cmdc.CMD_BAUD, version)
+    set_uart_rate(rate or BAUD)
+    baud_revert_ms = revert_ms
+    debug_log(f"UART at {uart_rate} baud")
+
+
+def handle_echo(payload: bytes, version: int):
+    # Link test: the requested number of pattern bytes, for the host to check byte by byte
+    if len(payload) < cmdc.ECHO_LEN:
+        debug_log(f"Invalid ECHO payload ({len(payload)} bytes)")
+        return  # the host counts it as lost
+    seq, size = struct.unpack_from(cmdc.ECHO_FMT, payload)
+    size = min(size, cmdc.max_payload(version) - cmdc.ECHO_REPLY_LEN)
+    reply = struct.pack(cmdc.ECHO_REPLY_FMT, seq) + codec.echo_pattern(seq, size)
+    send(codec.encode_frame(BLOCK_ID, cmdc.reply_cmd(cmdc.CMD_ECHO), reply, version))
+
+
+def handle_status(is_broadcast: bool, rx_ticks: int):
+    # State and capture health from what's already in RAM: cheap enough to poll
+    payload = struct.pack(cmdc.STATUS_FMT, block_state, run_id,
+                          fifo_comms.wp // fifo_comms.BYTES_PER_SAMP, fifo_comms.int_counter,
+                          fifo_comms.lost_pkt_total & 0xFFFF, fifo_comms.ts_rollovers & 0xFFFF,
+                          gc.mem_free(), capture_bytes)
+    packet = codec.encode_frame(BLOCK_ID, cmdc.reply_cmd(cmdc.CMD_STATUS), payload)
+    if is_broadcast:
+        send_in_slot(packet, rx_ticks)
+    else:
+        send(packet)
+
+
+def check_baud_revert():
+    # The host lost us (or forgot us): nothing valid heard for a while, so
+    # go back to the rate everyone else on the bus speaks
+    if uart_rate != BAUD and time.ticks_diff(time.ticks_ms(), last_rx_ms) > baud_revert_ms:
+        set_uart_rate(BAUD)
+        debug_log("UART back at base rate")
+
+
+def handle_protocol(is_broadcast: bool, rx_ticks: int):
+    # Tell the host the highest frame version this firmware speaks
+    packet = codec.constant_frame(BLOCK_ID, cmdc.reply_cmd(cmdc.CMD_PROTOCOL), bytes([cmdc.PROTOCOL_VERSION]))
+    if is_broadcast:
+        send_in_slot(packet, rx_ticks)
+    else:
+        send(packet)
+
+
+def handle_dump(is_broadcast: bool, payload: bytes, version: int):
     debug_log(f"DUMP command received, block_id={BLOCK_ID}, broadcast={is_broadcast}")
     print("DUMP request received")
-    dump("overall_buffer.bin")
-    debug_log("DUMP transmission completed, sending ACK")
-    send_ack(cmdc.CMD_DUMP)
-    debug_log("ACK sent for DUMP command")
+    window = None
+    if len(payload) >= cmdc.DUMP_WINDOW_LEN:
+        (window,) = struct.unpack_from(cmdc.DUMP_WINDOW_FMT, payload)
+    if len(payload) >= cmdc.DUMP_WINDOW_LEN + cmdc.DUMP_TAG_LEN:
+        # Conditional dump: the host already holds a capture with this tag
+        known = struct.unpack_from(cmdc.DUMP_TAG_FMT, payload, cmdc.DUMP_WINDOW_LEN)
+        try:
+            unchanged = tuple(known) == capture_tag()
+        except Exception:
+            unchanged = False  # no capture; dump() reports it
+        if unchanged:
+            reply = cmdc.reply_cmd(cmdc.CMD_DUMP_UNCHANGED)
+            send(codec.encode_frame(BLOCK_ID, reply, struct.pack(cmdc.DUMP_TAG_FMT, *known), version))
+            debug_log("DUMP not modified")
+            return
+    # v2 requests get v2 frames, and with them 2 KB chunks
+    dump(CAPTURE_FILE, window or None, version)
+    debug_log("DUMP window sent")
+
+
+def handle_dump_ack(payload: bytes, version: int):
+    # Next window from next_seq; gaps before it come back later as CMD_DUMP_RESEND
+    if len(payload) != cmdc.DUMP_ACK_LEN:
+        debug_log(f"Invalid DUMP_ACK payload ({len(payload)} bytes)")
+        return  # the host sees an empty window and asks for its chunks again later
+    next_seq, window = struct.unpack(cmdc.DUMP_ACK_FMT, payload)
+    chunk_size = cmdc.dump_chunk_size(version)
+    try:
+        chunk_count = count_chunks(os.stat(CAPTURE_FILE)[6], chunk_size)
+        with open(CAPTURE_FILE, "rb") as f:
+            send_window(f, chunk_count, next_seq, window, version)
+    except Exception as e:
+        debug_log(f"ERROR in DUMP_ACK: {e}")
+        send_ack(cmdc.CMD_DUMP, version)
+
+
+def handle_dump_resend(payload: bytes, version: int):
+    # Selective repeat: send only the chunk ranges the host is missing, in one burst
+    ranges = [struct.unpack_from(cmdc.DUMP_RANGE_FMT, payload, i)
+              for i in range(0, len(payload) - cmdc.DUMP_RANGE_LEN + 1, cmdc.DUMP_RANGE_LEN)]
+    debug_log(f"DUMP_RESEND for {len(ranges)} ranges")
+    tx_begin()
+    try:
+        with open(CAPTURE_FILE, "rb") as f:
+            for first_seq, count in ranges:
+                send_chunks(f, first_seq, count, version)
+    except Exception as e:
+        debug_log(f"ERROR in DUMP_RESEND: {e}")
+    uart.write(build_ack(cmdc.CMD_DUMP_RESEND, version))
+    tx_end()
 
 
-def handle_set_sensor(is_broadcast: bool, payload: bytes):
+def handle_set_sensor(is_broadcast: bool, payload: bytes, rx_ticks: int):
     global gun_sensor_type
     try:
         s = payload.decode().strip()
         if s in ('NC', 'NO'):
             gun_sensor_type = s
             print(f"Sensor type set to: {s}")
-            if not is_broadcast:
-                send_ack(cmdc.CMD_SET_SENSOR)
+            reply_ack(cmdc.CMD_SET_SENSOR, is_broadcast, rx_ticks)
         else:
             print("Invalid sensor type payload")
     except Exception as e:
         print("Decode error:", e)
 
 
-def handle_set_gender(is_broadcast: bool, payload: bytes):
+def handle_set_gender(is_broadcast: bool, payload: bytes, rx_ticks: int):
     global current_gender
     try:
         s = payload.decode().strip()
         if s in ('M', 'F'):
             current_gender = s
             print(f"Gender set to: {s}")
-            if not is_broadcast:
-                send_ack(cmdc.CMD_SET_GENDER)
+            reply_ack(cmdc.CMD_SET_GENDER, is_broadcast, rx_ticks)
         else:
             print("Invalid gender payload")
     except Exception as e:
         print("Decode error:", e)
 
 
-def handle_send_rt_report():
+def build_rt_report() -> bytes:
     global rt_timestamp, gun_timestamp
     print('rt_timestamp', rt_timestamp)
     print('gun_timestamp', gun_timestamp)
@@ -167,101 +373,153 @@ def handle_send_rt_report():
         # pre calculated 1/32768 for rtc timestamps in microseconds
         calculated_reaction = int(
             ((rt_timestamp - gun_timestamp) * 0.000030517578125 * 1_000_000))
-        b = calculated_reaction.to_bytes(3, 'big')
         # CA (calc) + calculated reaction time
-        packet = bytes(
-            [cmdc.STX, BLOCK_ID, cmdc.reply_cmd(cmdc.CMD_SEND_RT_REPORT), (len(b) + 2), 0x43, 0x41]) + b
-        packet += bytes([calc_checksum(packet)])
+        payload = b'CA' + calculated_reaction.to_bytes(3, 'big')
     elif rt_timestamp is not None and gun_timestamp is None:
-        packet = bytes([cmdc.STX, BLOCK_ID, cmdc.reply_cmd(cmdc.CMD_SEND_RT_REPORT), 2,
-                       0x4E, 0x47])  # NG--no gun
-        packet += bytes([calc_checksum(packet)])
+        payload = b'NG'  # NG--no gun
     elif rt_timestamp is None and gun_timestamp is not None:
-        packet = bytes([cmdc.STX, BLOCK_ID, cmdc.reply_cmd(cmdc.CMD_SEND_RT_REPORT), 2,
-                       0x4E, 0x52])  # NR--no reaction
-        packet += bytes([calc_checksum(packet)])
-    elif rt_timestamp is None and gun_timestamp is None:
-        packet = bytes([cmdc.STX, BLOCK_ID, cmdc.reply_cmd(cmdc.CMD_SEND_RT_REPORT), 2,
-                       0x4E, 0x44])  # ND--no data
-        packet += bytes([calc_checksum(packet)])
-    send(packet)
+        payload = b'NR'  # NR--no reaction
+    else:
+        payload = b'ND'  # ND--no data
+    return codec.encode_frame(BLOCK_ID, cmdc.reply_cmd(cmdc.CMD_SEND_RT_REPORT), payload)
+
+
+def handle_send_rt_report(is_broadcast: bool, rx_ticks: int):
+    packet = build_rt_report()
+    if is_broadcast:
+        send_in_slot(packet, rx_ticks)  # whole-heat collection
+    else:
+        send(packet)
+
+
+def count_chunks(file_size, chunk_size=cmdc.DUMP_CHUNK_SIZE):
+    return (file_size + chunk_size - 1) // chunk_size
+
+
+chunk_frames = {}  # frame version -> codec.FrameBuffer, allocated on first dump
+
+
+def send_chunks(f, first_seq, count, version=1):
+    """
+    Write chunks first_seq..first_seq+count-1 of an open file back to back, in
+    the chunk size and frame version of the request; the caller holds RTS with
+    tx_begin()/tx_end(). Returns (chunks, bytes) sent.
+    """
+    chunk_size = cmdc.dump_chunk_size(version)
+    fb = chunk_frames.get(version)
+    if fb is None:
+        fb = chunk_frames[version] = codec.FrameBuffer(cmdc.DUMP_SEQ_LEN + chunk_size, version)
+    data = fb.payload[cmdc.DUMP_SEQ_LEN:]
+    reply = cmdc.reply_cmd(cmdc.CMD_DUMP)
+    f.seek(first_seq * chunk_size)
+    sent_chunks = 0
+    sent_bytes = 0
+    for seq in range(first_seq, first_seq + count):
+        n = f.readinto(data)  # straight into the frame, no per-chunk allocation
+        if not n:
+            break
+        struct.pack_into(cmdc.DUMP_SEQ_FMT, fb.payload, 0, seq)
+        uart.write(fb.finish(BLOCK_ID, reply, cmdc.DUMP_SEQ_LEN + n))
+        sent_chunks += 1
+        sent_bytes += n
+    return sent_chunks, sent_bytes
+
+
+def send_window(f, chunk_count, first_seq, count, version=1, lead=b''):
+    """
+    Send lead, chunks first_seq..first_seq+count-1 and the window's end marker
+    as one burst with RTS held: no turnaround pause between frames. The end
+    marker is the CMD_DUMP_ACK reply, or the CMD_DUMP reply after the last chunk.
+    """
+    last = first_seq + count >= chunk_count
+    tx_begin()
+    try:
+        if lead:
+            uart.write(lead)
+        return send_chunks(f, first_seq, count, version)
+    finally:
+        uart.write(build_ack(cmdc.CMD_DUMP if last else cmdc.CMD_DUMP_ACK, version))
+        tx_end()
 
 
-def dump(filepath, chunk_size=255):
+def dump(filepath, window=None, version=1):
+    """Send the info frame and the first window (the whole file without a window)."""
     debug_log(f"Starting dump of file: {filepath}")
-    chunk_count = 0
-    total_bytes = 0
     
     try:
+        file_size = os.stat(filepath)[6]  # st_size
+        chunk_size = cmdc.dump_chunk_size(version)
+        chunk_count = count_chunks(file_size, chunk_size)
         with open(filepath, "rb") as f:
-            # Get file size for logging
-            try:
-                import os
-                file_size = os.stat(filepath)[6]  # st_size
-                debug_log(f"File opened: {filepath}, size: {file_size} bytes")
-            except:
-                debug_log(f"File opened: {filepath}")
-            
-            while True:
-                try:
-                    chunk = f.read(chunk_size)
-                except Exception as e:
-                    debug_log(f"ERROR reading chunk: {e}")
-                    break
-                
-                if not chunk:
-                    break
+            debug_log(f"File opened: {filepath}, size: {file_size} bytes")
+            # Announce the capture first: the host preallocates, tracks progress against
+            # the chunk count, checks the CRC and knows when it's done without a timeout
+            info = struct.pack(cmdc.DUMP_INFO_FMT, file_size, chunk_size)
+            info += struct.pack(cmdc.DUMP_TAG_FMT, *capture_tag(filepath))
+            info += struct.pack(cmdc.DUMP_RUN_FMT, chunk_count, gun_timestamp or 0, rt_timestamp or 0)
+            packet = codec.encode_frame(BLOCK_ID, cmdc.reply_cmd(cmdc.CMD_DUMP_INFO), info, version)
+            sent_chunks, total_bytes = send_window(f, chunk_count, 0, window or chunk_count, version, packet)
                 
-                chunk_count += 1
-                total_bytes += len(chunk)
-                
-                try:
-                    packet = bytes([cmdc.STX, BLOCK_ID, cmdc.reply_cmd(cmdc.CMD_DUMP), len(chunk)]) + chunk
-                    packet += bytes([calc_checksum(packet)])
-                    send(packet)
-                except Exception as e:
-                    debug_log(f"ERROR sending chunk {chunk_count}: {e}")
-                    break
-                
-        debug_log(f"Transmission complete: {chunk_count} chunks, {total_bytes} bytes")
-        print("File transmission complete.")
+        debug_log(f"First window sent: {sent_chunks} of {chunk_count} chunks, {total_bytes} bytes")
+        print("File transmission started.")
         
     except Exception as e:
         debug_log(f"ERROR in dump function: {e}")
         print("Failed to dump file:", e)
+        send_ack(cmdc.CMD_DUMP, version)
 
 
 # --- Main Loop ---
 
 def listen():
+    global last_rx_ms
     print("Listening (binary protocol)...")
     BOOT_LIGHT.value(1)
     while True:
         is_broadcast = False
         result = read_packet()
         if not result:
+            check_baud_revert()
             continue
+        rx_ticks = time.ticks_us()
+        last_rx_ms = time.ticks_ms()
 
-        block_id, cmd, payload = result
+        block_id, cmd, payload, version = result
 
         if block_id not in (BLOCK_ID, cmdc.BROADCAST_ID):
             continue  # Not for this node, not broadcast
         if block_id == cmdc.BROADCAST_ID:
             is_broadcast = True
         if cmd == cmdc.CMD_PING:
-            handle_ping(is_broadcast)
+            handle_ping(is_broadcast, rx_ticks)
         elif cmd == cmdc.CMD_ARM:
-            handle_arm(is_broadcast)
+            handle_arm(is_broadcast, rx_ticks)
         elif cmd == cmdc.CMD_SET:
             handle_set(is_broadcast)
         elif cmd == cmdc.CMD_DUMP:
-            handle_dump(is_broadcast)
+            handle_dump(is_broadcast, payload, version)
         elif cmd == cmdc.CMD_SET_SENSOR:
-            handle_set_sensor(is_broadcast, payload)
+            handle_set_sensor(is_broadcast, payload, rx_ticks)
         elif cmd == cmdc.CMD_SET_GENDER:
-            handle_set_gender(is_broadcast, payload)
+            handle_set_gender(is_broadcast, payload, rx_ticks)
         elif cmd == cmdc.CMD_SEND_RT_REPORT:
-            handle_send_rt_report()
+            handle_send_rt_report(is_broadcast, rx_ticks)
+        elif cmd == cmdc.CMD_DUMP_RESEND:
+            if not is_broadcast:
+                handle_dump_resend(payload, version)
+        elif cmd == cmdc.CMD_DUMP_ACK:
+            if not is_broadcast:
+                handle_dump_ack(payload, version)
+        elif cmd == cmdc.CMD_PROTOCOL:
+            handle_protocol(is_broadcast, rx_ticks)
+        elif cmd == cmdc.CMD_BAUD:
+            if not is_broadcast:
+                handle_baud(payload, version)
+        elif cmd == cmdc.CMD_ECHO:
+            if not is_broadcast and len(payload) >= cmdc.ECHO_LEN:
+                handle_echo(payload, version)
+        elif cmd == cmdc.CMD_STATUS:
+            handle_status(is_broadcast, rx_ticks)
         else:
             print(f"Unknown command: {cmd}")
 
@@ -1,42 +1,72 @@
-import checksum
+import struct
 from typing import Literal
+import codec
 import command_codes as cmdc
 
 
+def build_frame(block_id: int, cmd: int, payload: bytes = b'', version: int = 1) -> bytes:
+    """Frame a payload as v1 (sum8, up to 255 bytes) or v2 (16-bit length, CRC-16)."""
+    return codec.encode_frame(block_id, cmd, payload, version)
+
+
+# Frames that only depend on their arguments come from codec's constant-frame cache.
+
 def build_ping_packet(block_id: int) -> bytes:
-    header = bytes([cmdc.STX, block_id, cmdc.CMD_PING, 0])  # 0-length payload
-    return header + bytes([checksum.calc_checksum(header)])
+    return codec.constant_frame(block_id, cmdc.CMD_PING)  # 0-length payload
+
+
+def build_protocol_packet(block_id: int) -> bytes:
+    return codec.constant_frame(block_id, cmdc.CMD_PROTOCOL)
 
 
 def build_gender_packet(block_id: int, gender: Literal['M', 'F']) -> bytes:
-    payload = gender.encode('utf-8')
-    header = bytes([cmdc.STX, block_id, cmdc.CMD_SET_GENDER, 1])
-    packet = header + payload
-    return packet + bytes([checksum.calc_checksum(packet)])
+    return codec.constant_frame(block_id, cmdc.CMD_SET_GENDER, gender.encode('utf-8'))
 
 
 def build_arm_packet(block_id: int) -> bytes:
-    header = bytes([cmdc.STX, block_id, cmdc.CMD_ARM, 0])
-    return header + bytes([checksum.calc_checksum(header)])
+    return codec.constant_frame(block_id, cmdc.CMD_ARM)
 
 
 def build_set_packet() -> bytes:
-    header = bytes([cmdc.STX, cmdc.BROADCAST_ID, cmdc.CMD_SET, 0])
-    return header + bytes([checksum.calc_checksum(header)])
+    return codec.constant_frame(cmdc.BROADCAST_ID, cmdc.CMD_SET)
 
 
 def build_sensor_type_packet(block_id: int, sensor_type: Literal['NC', 'NO']) -> bytes:
-    payload = sensor_type.encode('utf-8')
-    header = bytes([cmdc.STX, block_id, cmdc.CMD_SET_SENSOR, 2])
-    packet = header + payload
-    return packet + bytes([checksum.calc_checksum(packet)])
+    return codec.constant_frame(block_id, cmdc.CMD_SET_SENSOR, sensor_type.encode('utf-8'))
 
 
 def build_send_report_packet(block_id: int) -> bytes:
-    header = bytes([cmdc.STX, block_id, cmdc.CMD_SEND_RT_REPORT, 0])
-    return header + bytes([checksum.calc_checksum(header)])
+    return codec.constant_frame(block_id, cmdc.CMD_SEND_RT_REPORT)
+
+
+def build_dump_packet(block_id: int, window: int | None = None, version: int = 1,
+                      tag: tuple[int, int] | None = None) -> bytes:
+    payload = struct.pack(cmdc.DUMP_WINDOW_FMT, window) if window else b''
+    if tag is None:
+        return codec.constant_frame(block_id, cmdc.CMD_DUMP, payload, version)
+    # the host's copy is (run id, CRC32); a tag needs the window in front of it
+    payload = struct.pack(cmdc.DUMP_WINDOW_FMT, window or 0) + struct.pack(cmdc.DUMP_TAG_FMT, *tag)
+    return codec.encode_frame(block_id, cmdc.CMD_DUMP, payload, version)
+
+
+def build_dump_ack_packet(block_id: int, next_seq: int, window: int, version: int = 1) -> bytes:
+    payload = struct.pack(cmdc.DUMP_ACK_FMT, next_seq, window)
+    return codec.encode_frame(block_id, cmdc.CMD_DUMP_ACK, payload, version)
+
+
+def build_dump_resend_packet(block_id: int, ranges: list[tuple[int, int]], version: int = 1) -> bytes:
+    payload = b''.join(struct.pack(cmdc.DUMP_RANGE_FMT, first, count)
+                       for first, count in ranges[:cmdc.DUMP_RESEND_MAX_RANGES])
+    return codec.encode_frame(block_id, cmdc.CMD_DUMP_RESEND, payload, version)
+
+
+def build_baud_packet(block_id: int, rate: int, revert_ms: int, version: int = 1) -> bytes:
+    return codec.constant_frame(block_id, cmdc.CMD_BAUD, struct.pack(cmdc.BAUD_FMT, rate, revert_ms), version)
+
+
+def build_echo_packet(block_id: int, seq: int, size: int, version: int = 1) -> bytes:
+    return codec.encode_frame(block_id, cmdc.CMD_ECHO, struct.pack(cmdc.ECHO_FMT, seq, size), version)
 
 
-def build_dump_packet(block_id: int) -> bytes:
-    header = bytes([cmdc.STX, block_id, cmdc.CMD_DUMP, 0])
-    return header + bytes([checksum.calc_checksum(header)])
\ No newline at end of file
+def build_status_packet(block_id: int) -> bytes:
+    return codec.constant_frame(block_id, cmdc.CMD_STATUS)
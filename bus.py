@@ -0,0 +1,173 @@
+"""
+Long-lived RS485 bus connection shared by every endpoint.
+
+The port is opened once and kept open; transactions are serialized by a lock
+so two requests can never talk on the half-duplex bus at once. After a serial
+error the port is closed and transparently reopened by the next transaction.
+
+RttEstimator keeps the measured reply times that the host derives its
+deadlines from.
+"""
+import threading
+import time
+from contextlib import contextmanager
+import serial
+import codec
+
+
+class RS485Bus:
+    def __init__(self, open_port, name: str = 'rs485', recorder=None, channel: int = 0):
+        """
+        open_port() must return a new, open serial.Serial-like object. With a
+        recorder.FrameRecorder, the port's traffic is recorded under channel.
+        """
+        self.name = name
+        self._open_port = open_port
+        self._recorder = recorder
+        self._channel = channel
+        self._lock = threading.Lock()
+        self.ser = None
+        self.decoder = codec.FrameDecoder()
+        self.stats = {
+            "opens": 0,
+            "reconnects": 0,
+            "errors": 0,
+            "last_error": None,
+            "transactions": {},
+        }
+
+    @property
+    def is_open(self) -> bool:
+        return self.ser is not None and self.ser.is_open
+
+    def open(self):
+        with self._lock:
+            self._ensure_open()
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+    def _ensure_open(self):
+        if self.is_open:
+            return self.ser
+        if self.stats["opens"]:
+            self.stats["reconnects"] += 1
+        self.ser = self._open_port()
+        if self._recorder is not None:
+            self.ser = self._recorder.tap(self.ser, self._channel)
+        self.stats["opens"] += 1
+        self.decoder.clear()  # nothing buffered from a previous connection is trustworthy
+        return self.ser
+
+    def _close(self):
+        if self.ser is not None:
+            try:
+                self.ser.close()
+            except (serial.SerialException, OSError):
+                pass
+        self.ser = None
+
+    @contextmanager
+    def transaction(self, name: str):
+        """
+        Hold the bus for one exchange and yield (ser, decoder).
+        Serial errors close the port so the next transaction reconnects.
+        """
+        with self._lock:
+            start = time.monotonic()
+            try:
+                ser = self._ensure_open()
+                # late replies to an earlier transaction must not satisfy this one
+                ser.reset_input_buffer()
+                self.decoder.clear()
+                yield ser, self.decoder
+            except (serial.SerialException, OSError) as e:
+                self.stats["errors"] += 1
+                self.stats["last_error"] = f"{name}: {e}"
+                self._close()
+                raise
+            finally:
+                self._record(name, time.monotonic() - start)
+
+    def _record(self, name: str, duration: float):
+        t = self.stats["transactions"].setdefault(name, {"count": 0, "total_s": 0.0, "max_s": 0.0})
+        t["count"] += 1
+        t["total_s"] += duration
+        t["max_s"] = max(t["max_s"], duration)
+
+    def snapshot(self) -> dict:
+        """Copy of the stats plus live decoder counters, safe to return as JSON."""
+        transactions = {}
+        for name, t in self.stats["transactions"].items():
+            transactions[name] = dict(t, avg_s=t["total_s"] / t["count"] if t["count"] else 0.0)
+        return {
+            "name": self.name,
+            "open": self.is_open,
+            "opens": self.stats["opens"],
+            "reconnects": self.stats["reconnects"],
+            "errors": self.stats["errors"],
+            "last_error": self.stats["last_error"],
+            "frames_ok": self.decoder.frames_ok,
+            "bad_checksums": self.decoder.bad_checksums,
+            "skipped_bytes": self.decoder.skipped_bytes,
+            "transactions": transactions,
+        }
+
+
+class RttEstimator:
+    """
+    Smoothed round-trip time and its variation per key (e.g. block and
+    command), the way TCP computes its retransmission timeout (RFC 6298):
+    timeout = SRTT + 4 * RTTVAR, clamped to [lower, upper]. Each expiry
+    doubles the timeout for that key until the next reply is measured, so a
+    block that stopped answering costs at most `upper` per exchange.
+    """
+
+    ALPHA = 1 / 8
+    BETA = 1 / 4
+    MAX_BACKOFF = 64
+
+    def __init__(self, initial: float, lower: float, upper: float):
+        self.initial = initial  # before the first sample
+        self.lower = lower
+        self.upper = upper
+        self._estimates = {}  # key -> [srtt, rttvar, backoff]
+
+    def timeout(self, key, initial: float | None = None, lower: float | None = None,
+                upper: float | None = None) -> float:
+        """Seconds to wait for the reply; the limits override the defaults for this call."""
+        upper = self.upper if upper is None else upper
+        est = self._estimates.get(key)
+        if est is None:
+            return min(upper, self.initial if initial is None else initial)
+        srtt, rttvar, backoff = est
+        return min(upper, max(self.lower if lower is None else lower, srtt + 4 * rttvar) * backoff)
+
+    def sample(self, key, rtt: float):
+        est = self._estimates.get(key)
+        if est is None:
+            self._estimates[key] = [rtt, rtt / 2, 1]
+            return
+        srtt, rttvar, _ = est
+        rttvar = (1 - self.BETA) * rttvar + self.BETA * abs(srtt - rtt)
+        srtt = (1 - self.ALPHA) * srtt + self.ALPHA * rtt
+        self._estimates[key] = [srtt, rttvar, 1]
+
+    def expired(self, key):
+        est = self._estimates.get(key)
+        if est is not None:
+            est[2] = min(est[2] * 2, self.MAX_BACKOFF)
+
+    def clear(self):
+        self._estimates.clear()
+
+    def snapshot(self) -> dict:
+        return {
+            "/".join(str(part) for part in (key if isinstance(key, tuple) else (key,))): {
+                "srtt_ms": round(srtt * 1000, 2),
+                "rttvar_ms": round(rttvar * 1000, 2),
+                "timeout_ms": round(self.timeout(key) * 1000, 2),
+            }
+            for key, (srtt, rttvar, _) in list(self._estimates.items())
+        }
@@ -1,2 +1,51 @@
+try:
+    from binascii import crc_hqx
+except ImportError:  # MicroPython has no crc_hqx
+    crc_hqx = None
+try:
+    import micropython
+except ImportError:
+    micropython = None
+
+
 def calc_checksum(data: bytes) -> int:
-    return sum(data) % 256
\ No newline at end of file
+    return sum(data) % 256
+
+
+def _crc16_table() -> list[int]:
+    table = []
+    for i in range(256):
+        crc = i << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x1021) if crc & 0x8000 else crc << 1
+        table.append(crc & 0xFFFF)
+    return table
+
+
+CRC16_TABLE = _crc16_table()
+
+
+def calc_crc16(data: bytes, crc: int = 0) -> int:
+    """CRC-16/XMODEM (poly 0x1021, init 0) of v2 frames; pass crc to continue a running CRC."""
+    if crc_hqx:
+        return crc_hqx(data, crc)  # the same CRC in C
+    for b in data:
+        crc = ((crc << 8) & 0xFFFF) ^ CRC16_TABLE[(crc >> 8) ^ b]
+    return crc
+
+
+if micropython:
+    from array import array
+    _CRC16_TABLE_H = array('H', CRC16_TABLE)
+
+    @micropython.viper
+    def _crc16_viper(data, crc: int) -> int:
+        buf = ptr8(data)
+        table = ptr16(_CRC16_TABLE_H)
+        for i in range(int(len(data))):
+            crc = ((crc << 8) & 0xFFFF) ^ table[((crc >> 8) ^ buf[i]) & 0xFF]
+        return crc
+
+    def calc_crc16(data: bytes, crc: int = 0) -> int:
+        # the block's table-driven CRC, compiled to native code: a 2 KB chunk stays well under its wire time
+        return _crc16_viper(data, crc)
@@ -1,4 +1,5 @@
 STX = 0xAA
+STX2 = 0xAB  # start of a protocol v2 frame
 CMD_PING = 0x01
 CMD_ARM = 0x02
 CMD_SET = 0x03
@@ -6,9 +7,93 @@ CMD_DUMP = 0x04
 CMD_SET_SENSOR = 0x05
 CMD_SET_GENDER = 0x06
 CMD_SEND_RT_REPORT = 0x07
+CMD_DUMP_INFO = 0x08  # sent by the block, as a reply, ahead of the chunks of a CMD_DUMP
+CMD_DUMP_RESEND = 0x09  # host asks for ranges of dump chunks again
+CMD_DUMP_ACK = 0x0A  # host acks a dump window and asks for the next one
+CMD_PROTOCOL = 0x0B  # block replies with the highest frame version it speaks
+CMD_DUMP_UNCHANGED = 0x0C  # sent by the block, as a reply, instead of a capture the host already has
+CMD_BAUD = 0x0D  # host moves one block to another UART rate; the block acks at the old rate, then switches
+CMD_ECHO = 0x0E  # link test: the block answers with as many pattern bytes as asked for
+CMD_STATUS = 0x0F  # block replies with its state and capture health counters
 
 REPLY_FLAG = 0x40
 BROADCAST_ID = 0x99
 
+# v1 frame: [STX][block_id][cmd][len][payload][sum8 of all before it]
+# v2 frame: [STX2][block_id][cmd][len hi][len lo][sum8 of those 5][payload][CRC-16/XMODEM hi][lo]
+# The CRC covers everything before it. Blocks answer v2 requests in v2; firmware
+# that predates CMD_PROTOCOL never answers it and is only ever sent v1 frames.
+PROTOCOL_VERSION = 2
+V2_HEADER_LEN = 6
+V2_MAX_PAYLOAD = 4096
+
+# Blocks answer a broadcast in their own slot: (BLOCK_ID - 1) * BROADCAST_SLOT_US
+# after the request, so replies from different blocks never collide. A
+# block acks ARM in its slot first and re-initialises the IMU and capture
+# buffer after, so the slots hold however long that setup takes.
+BROADCAST_SLOT_US = 1000
+
+# Optional CMD_DUMP payload: chunks per window. With it the block sends the
+# info frame and the first window, then one more window per CMD_DUMP_ACK;
+# without it the whole capture is streamed in one go. A window ends with a
+# zero-length CMD_DUMP_ACK reply, the last one with the CMD_DUMP reply.
+DUMP_WINDOW_FMT = '>H'
+DUMP_WINDOW_LEN = 2
+# A capture's tag: the block's run counter (bumped by every CMD_SET) and the
+# CRC32 of the whole file. It follows the info fields in CMD_DUMP_INFO. A host
+# that already holds a capture appends its tag to the CMD_DUMP window; if it
+# still matches, the only reply is CMD_DUMP_UNCHANGED carrying the tag.
+DUMP_TAG_FMT = '>II'
+DUMP_TAG_LEN = 8
+# CMD_DUMP_ACK payload: first seq of the next window, window. Not cumulative:
+# chunks lost in earlier windows are asked for by CMD_DUMP_RESEND at the end.
+DUMP_ACK_FMT = '>HH'
+DUMP_ACK_LEN = 4
+# CMD_DUMP_INFO payload: total capture bytes, data bytes per chunk, then the
+# tag, then the run fields: chunk count and the gun / reaction RTC timestamps
+# of the run (0 when there was none). Older firmware stops after the sizes or
+# the tag.
+DUMP_INFO_FMT = '>IH'
+DUMP_INFO_LEN = 6
+DUMP_RUN_FMT = '>HII'
+DUMP_RUN_LEN = 10
+# Every dump chunk payload is a big-endian u16 sequence number followed by up
+# to DUMP_CHUNK_SIZE bytes of the file, taken from offset seq * chunk size.
+DUMP_SEQ_FMT = '>H'
+DUMP_SEQ_LEN = 2
+DUMP_CHUNK_SIZE = 255 - DUMP_SEQ_LEN
+DUMP_CHUNK_SIZE_V2 = 2048  # for dumps requested with v2 frames
+# CMD_DUMP_RESEND payload: up to DUMP_RESEND_MAX_RANGES of (first seq, count)
+DUMP_RANGE_FMT = '>HH'
+DUMP_RANGE_LEN = 4
+DUMP_RESEND_MAX_RANGES = 255 // DUMP_RANGE_LEN
+# CMD_BAUD payload: the new rate (0 = back to the block's base rate) and the
+# ms without a valid frame after which the block falls back to the base rate
+# by itself, so a switch the host can't follow never strands the block.
+BAUD_FMT = '>IH'
+BAUD_LEN = 6
+# CMD_ECHO payload: seq, reply data bytes (anything after it is ignored). The
+# reply is the seq, then that many bytes of codec.echo_pattern(seq, ...),
+# capped to what one frame of the request's version holds.
+ECHO_FMT = '>HH'
+ECHO_LEN = 4
+ECHO_REPLY_FMT = '>H'
+ECHO_REPLY_LEN = 2
+# CMD_STATUS reply: state, run id, samples in the capture buffer, FIFO
+# threshold interrupts, IMU lost packets, timestamp rollovers, free heap
+# bytes, capture file bytes. Always a v1 frame; broadcasts answer in slots.
+STATUS_FMT = '>BIIIHHII'
+STATUS_LEN = 25
+STATE_IDLE = 0  # nothing armed since boot
+STATE_ARMED = 1  # CMD_ARM done, waiting for CMD_SET
+STATE_LOGGING = 2  # inside start_loop(); the block doesn't listen then, so the host never sees it
+STATE_FINISHED = 3  # the run is over and its capture is on flash
+
 def reply_cmd(cmd):
-    return (cmd | REPLY_FLAG)
\ No newline at end of file
+    return (cmd | REPLY_FLAG)
+
+def dump_chunk_size(version):
+    return DUMP_CHUNK_SIZE_V2 if version >= 2 else DUMP_CHUNK_SIZE
+
+def max_payload(version):
+    return V2_MAX_PAYLOAD if version >= 2 else 255
\ No newline at end of file
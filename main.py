@@ -1,24 +1,58 @@
+import asyncio
+import itertools
+import json
+import os
 import serial
 import serial.rs485
+import struct
+import threading
 import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from typing import Literal
-from fastapi import FastAPI
+from fastapi import FastAPI, Query, Request
+from fastapi.responses import JSONResponse
 import command_codes as cmdc
-import checksum as cks
 import builders as bld
+import codec
+from scheduler import PRIORITY_URGENT, PRIORITY_CONTROL, PRIORITY_BULK
+from topology import Lane, parse_topology
+from bus import RttEstimator
+from recorder import FrameRecorder
 from playsound3 import playsound
 import gpiozero
-from gpiozero.pins.pigpio import PiGPIOFactory
 
 
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One long-lived port per bus for the whole app instead of one open per request
+    dump_cache.update(load_dump_cache())
+    for lane in lanes:
+        try:
+            lane.bus.open()
+        except (serial.SerialException, OSError) as e:
+            print(f"RS485 port {lane.port} not available at startup, will retry on first use: {e}")
+        lane.scheduler.start()
+    try:
+        await restore_topology()  # ready without a /ping if the blocks are where they were
+    except (serial.SerialException, OSError) as e:
+        print(f"Cached topology not checked, /ping needed: {e}")
+    yield
+    if prefetch_task is not None:
+        prefetch_task.cancel()
+    for lane in lanes:
+        await lane.scheduler.stop()
+        lane.bus.close()
 
 
-def debug_packet(packet: bytes, label: str):
-    """Debug helper to print packet contents in hex format."""
-    hex_str = ' '.join(f'{b:02X}' for b in packet)
-    print(f"[DEBUG] {label}: {hex_str} (len={len(packet)})")
+app = FastAPI(lifespan=lifespan)
+
+
+@app.exception_handler(serial.SerialException)
+async def serial_error(request: Request, exc: serial.SerialException):
+    return JSONResponse(status_code=503, content={"detail": f"RS485 bus error: {exc}"})
 
 
 def _time_left(deadline: float) -> float:
@@ -27,9 +61,37 @@ def _time_left(deadline: float) -> float:
 
 
 active_blocks = []
+protocol_versions = {}  # block_id -> frame version agreed at discovery (v1 if missing)
+TOPOLOGY_CACHE = 'block_topology.json'  # blocks found by the last /ping, checked at startup
+dump_cache = {}  # block_id -> {"tag": (run id, CRC32), "filename", "bytes"} of the last verified dump
+DUMP_CACHE_FILE = 'dump_cache.json'  # dump_cache across restarts, next to TOPOLOGY_CACHE
+dump_cache_lock = threading.Lock()  # bus threads drop entries, the writer thread adds them
+baud_fallback = set()  # blocks that failed at DUMP_BAUD; dumped at BAUD until the next /ping
+block_status = {}  # block_id -> its last CMD_STATUS reply; blocks that never answered one aren't here
+dump_jobs = {}  # job id -> (MultiBusDump, task running it), oldest first
+foreground_dumps = set()  # MultiBusDumps a GET /dump is waiting on, aborted by /set like the jobs
+DUMP_JOB_HISTORY = 20  # finished jobs kept for polling
+_dump_job_ids = itertools.count(1)
+prefetch_task = None  # waits for the blocks to finish the current run, then starts a dump job
+prefetch_generation = 0  # bumped by every /set; a watcher from an earlier run stops at its next poll
+# Captures are written and fsynced here, so the SD card never holds up the bus;
+# one thread keeps the writes in the order the blocks finished.
+dump_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='dump-writer')
+
+# --- SIMULATION ---
+# REACT_SIM=1 swaps the RS485 ports for simulated block farms, one per bus
+# (see sim_blocks.py), and the Pi's GPIO for gpiozero's mock pins.
+sim_farms = []
+if os.environ.get('REACT_SIM'):
+    import sim_blocks
+    from gpiozero.pins.mock import MockFactory
+    gpiozero.Device.pin_factory = MockFactory()
+    sim_farms = [farm.start() for farm in sim_blocks.farms_from_env()]
+else:
+    from gpiozero.pins.pigpio import PiGPIOFactory
+    gpiozero.Device.pin_factory = PiGPIOFactory()
 
 # --- PINS ---
-gpiozero.Device.pin_factory = PiGPIOFactory()
 
 abort_pin = gpiozero.OutputDevice(pin=27)
 abort_pin.off()
@@ -74,12 +136,60 @@ false_start_alert_pin.when_activated = false_start_alert
 
 BLOCK_IDS = range(1, 11)  # block IDs 1 through 10
 SERIAL_PORT = '/dev/ttyAMA0'
+# Port -> block IDs wired to it; every port is a separate bus, driven in
+# parallel. REACT_TOPOLOGY='/dev/ttyAMA0=1-5;/dev/ttyAMA1=6-10' overrides it.
+TOPOLOGY = {SERIAL_PORT: list(BLOCK_IDS)}
 BAUD = 1500000
-TIMEOUT = 0.2  # seconds
-
-
-def open_rs485():
-    ser = serial.Serial(SERIAL_PORT, BAUD, timeout=TIMEOUT, rtscts=False)
+TIMEOUT = 0.2  # seconds to wait for a reply before its RTT is measured, and at most after
+MIN_REPLY_TIMEOUT = 0.02  # floor under measured reply timeouts, for host scheduling jitter
+POLL_INTERVAL = 0.002  # max serial read block when nothing is waiting
+MAX_RESEND_ROUNDS = 5  # selective-repeat rounds per dump before giving up
+DUMP_WINDOW_BYTES = 8 * 1024  # per dump window, ~57 ms at 1.5 Mbaud
+DUMP_START_TIMEOUT = 3.0  # the block opens its capture before the first window
+DUMP_START_MIN_TIMEOUT = 0.5  # ... and the first dump of a run also CRCs the whole file
+MAX_IDLE_WINDOWS = 3  # windows in a row with no chunk before giving up on a block
+PREFETCH_AFTER_RUN = True  # pull captures in the background as soon as a run ends
+RUN_POLL_INTERVAL = 0.25  # seconds between end-of-run pings after /set
+RUN_MAX_S = 15.0  # stop waiting for blocks to finish a run after this long
+SLOT_MARGIN = 0.005  # seconds after the last broadcast slot for turnaround and host jitter
+# Dump data runs at DUMP_BAUD, one block at a time (0 keeps BAUD). The MAX485 /
+# MAX1487 transceivers on the blocks are rated for 2.5 Mbps.
+DUMP_BAUD = 2500000
+BAUD_REVERT_MS = 300  # a block at DUMP_BAUD drops back to BAUD after this long without a frame
+BAUD_MAX_LOSS = 0.2  # share of chunks lost at DUMP_BAUD before a block is dumped at BAUD ...
+BAUD_ERROR_MIN_CHUNKS = 32  # ... once this many were asked for; a window that brings nothing falls back at once
+LINKTEST_COUNT = 100  # CMD_ECHO exchanges per block in /linktest
+LINKTEST_SIZE = 1024  # reply data bytes per echo (v1 blocks send at most 253)
+LINKTEST_MAX_COUNT = 10000  # echoes per block /linktest accepts
+LINKTEST_MAX_SIZE = cmdc.max_payload(2) - cmdc.ECHO_REPLY_LEN  # the most a v2 echo reply carries
+LINKTEST_BURST = 10  # echoes per scheduler step, so urgent traffic can cut in
+# Every byte in and out of the ports is kept in a ring buffer of this size for
+# POST /bus/capture and replay_capture.py (0 turns recording off)
+RECORDER_BYTES = 4 * 1024 * 1024
+
+
+# Measured reply times per (block, command): deadlines track the real bus, so a
+# lost reply costs a few RTTs rather than a worst-case constant.
+rtt = RttEstimator(TIMEOUT, MIN_REPLY_TIMEOUT, TIMEOUT)
+
+
+def reply_timeout(block_id: int, cmd: int) -> float:
+    """Seconds to wait for block_id's first reply frame to cmd."""
+    if cmd == cmdc.CMD_DUMP:
+        return rtt.timeout((block_id, cmd), DUMP_START_TIMEOUT, DUMP_START_MIN_TIMEOUT, DUMP_START_TIMEOUT)
+    return rtt.timeout((block_id, cmd))
+
+
+def broadcast_window() -> float:
+    """Time for every possible block to answer a broadcast in its slot."""
+    return len(BLOCK_IDS) * cmdc.BROADCAST_SLOT_US / 1_000_000 + SLOT_MARGIN
+
+
+def open_rs485(port: str):
+    if sim_farms:
+        # a pty has no RS485 driver; the farm handles bus direction itself
+        return serial.Serial(port, BAUD, timeout=POLL_INTERVAL)
+    ser = serial.Serial(port, BAUD, timeout=POLL_INTERVAL, rtscts=False)
     ser.rs485_mode = serial.rs485.RS485Settings(
         rts_level_for_tx=True,
         rts_level_for_rx=False,
@@ -87,429 +197,1317 @@ def open_rs485():
     return ser
 
 
+def make_lanes() -> list[Lane]:
+    if sim_farms:
+        topology = {farm.port: sorted(farm.blocks) for farm in sim_farms}
+    elif os.environ.get('REACT_TOPOLOGY'):
+        topology = parse_topology(os.environ['REACT_TOPOLOGY'])
+    else:
+        topology = TOPOLOGY
+    return [Lane(f'rs485-{i}', port, block_ids, lambda port=port: open_rs485(port), bus_recorder, i)
+            for i, (port, block_ids) in enumerate(topology.items())]
+
+
+bus_recorder = FrameRecorder(RECORDER_BYTES) if RECORDER_BYTES else None
+lanes = make_lanes()
+block_lanes = {}  # block_id -> Lane it answered discovery on
+
+
+def lane_of(block_id: int) -> Lane:
+    """The lane a block answered on, else the one the topology puts it on, else the first."""
+    if block_id in block_lanes:
+        return block_lanes[block_id]
+    return next((lane for lane in lanes if block_id in lane.block_ids), lanes[0])
+
+
+def group_by_lane(block_ids=None) -> list[tuple[Lane, list[int]]]:
+    """(lane, its share of block_ids) for every lane that has any; None means every lane with its topology IDs."""
+    if block_ids is None:
+        return [(lane, lane.block_ids) for lane in lanes]
+    groups = {}
+    for block_id in block_ids:
+        groups.setdefault(lane_of(block_id).name, []).append(block_id)
+    return [(lane, groups[lane.name]) for lane in lanes if lane.name in groups]
+
+
+async def on_lanes(name: str, fn, block_ids=None, priority: int = PRIORITY_CONTROL) -> list:
+    """
+    Run fn(ser, decoder, lane_block_ids) as one transaction on every lane with
+    any of block_ids, all lanes at once. Returns the results in lane order.
+    """
+    return await asyncio.gather(*(
+        lane.scheduler.run(name, lambda ser, decoder, ids=ids: fn(ser, decoder, ids), priority)
+        for lane, ids in group_by_lane(block_ids)))
+
+
 def ser_write(ser: serial.Serial, packet: bytes):
     # ser.reset_input_buffer()
     ser.write(packet)
-    ser.flush()
-    time.sleep(0.001)
+    ser.flush()  # no fixed pause after: reply deadlines come from measured RTTs
 
 
-def read_one_packet(ser: serial.Serial, deadline: float):
+def read_one_packet(ser: serial.Serial, decoder: codec.FrameDecoder, deadline: float):
     """
     Read exactly one framed packet: [STX][block_id][cmd][len][payload...][csum]
-    Returns (block_id, cmd, payload) or None if timeout/invalid.
+    Returns (block_id, cmd, payload) or None if timeout.
     """
-    # 1) Hunt for STX within remaining time
-    while _time_left(deadline) > 0:
-        b = ser.read(1)
-        if not b:
-            continue
-        if b[0] != cmdc.STX:
-            continue
-
-        # 2) Fixed 3-byte header
-        head = ser.read(3)
-        if len(head) != 3:
-            return None
-        block_id, cmd, length = head
-
-        # 3) Payload + checksum
-        payload = ser.read(length)
-        if len(payload) != length:
-            return None
-        csum = ser.read(1)
-        if len(csum) != 1:
+    while True:
+        for frame in decoder.frames():
+            return frame
+        if _time_left(deadline) <= 0:
             return None
+        decoder.read_from(ser)
 
-        full_wo = bytes([cmdc.STX]) + head + payload
-        if cks.calc_checksum(full_wo) != csum[0]:
-            continue  # bad frame; keep hunting
 
-        return (block_id, cmd, payload)
+def read_response(ser: serial.Serial, decoder: codec.FrameDecoder, expected_block_id: int, return_cmd, deadline: float | None = None):
+    """
+    Wait for a reply packet from a specific block_id/cmd.
+    Returns the verified (block_id, cmd, payload) frame as soon as it arrives,
+    or None if nothing matching validates before the deadline (now + the
+    block's measured reply timeout for cmd unless given).
+    """
+    expected_cmd = cmdc.reply_cmd(return_cmd)
+    sent_at = time.monotonic()
+    measured = deadline is None
+    if measured:
+        deadline = sent_at + reply_timeout(expected_block_id, return_cmd)
+    failures_before = decoder.bad_checksums
+
+    while True:
+        for block_id, cmd, payload in decoder.frames():
+            if block_id == expected_block_id and cmd == expected_cmd:
+                if measured:
+                    rtt.sample((block_id, return_cmd), time.monotonic() - sent_at)
+                return (block_id, cmd, payload)
+        if _time_left(deadline) <= 0:
+            break
+        decoder.read_from(ser)
 
+    failures = decoder.bad_checksums - failures_before
+    if failures:
+        print(f"[DEBUG] {failures} frames with bad checksum")
+    if measured:
+        rtt.expired((expected_block_id, return_cmd))
+    print("[DEBUG] No valid response frame parsed")
     return None
 
 
-def read_response(ser: serial.Serial, expected_block_id: int, return_cmd) -> bytes:
+def read_slotted_replies(ser: serial.Serial, decoder: codec.FrameDecoder, return_cmd, expected_ids, deadline: float | None = None) -> dict[int, bytes]:
     """
-    Wait for a reply packet from a specific block_id/cmd.
-    Always prints whatever raw bytes were captured, even if invalid.
-    Returns the full verified frame (with checksum) or b'' if not found.
+    Collect the slotted replies to a broadcast command.
+    Returns {block_id: payload} for every block that answered before the
+    deadline (end of the broadcast window unless given). Stops early once
+    every block in expected_ids has answered.
     """
     expected_cmd = cmdc.reply_cmd(return_cmd)
-    deadline = time.time() + TIMEOUT
-    raw = bytearray()
-
-    # Collect whatever arrives until timeout
-    while time.time() < deadline:
-        b = ser.read(1)
-        if b:
-            raw.append(b[0])
-        else:
-            time.sleep(0.001)
+    if deadline is None:
+        deadline = time.monotonic() + broadcast_window()
+    pending = {block_id for block_id in expected_ids}  # set() is shadowed by the /set endpoint
+    replies = {}
+
+    while True:
+        for block_id, cmd, payload in decoder.frames():
+            if cmd == expected_cmd and block_id not in replies:
+                replies[block_id] = payload
+                pending.discard(block_id)
+        if not pending or _time_left(deadline) <= 0:
+            break
+        decoder.read_from(ser)
 
-    if not raw:
-        print("[DEBUG] No bytes received at all")
-        return b''
+    return replies
 
-    # Show raw buffer in hex, even if incomplete
-    hex_str = ' '.join(f'{x:02X}' for x in raw)
-    print(f"[DEBUG] Raw buffer ({len(raw)} bytes): {hex_str}")
 
-    # Try to parse frames from raw
-    i = 0
-    while i < len(raw):
-        if raw[i] != cmdc.STX:
-            i += 1
-            continue
+def ack_bitmap(block_ids) -> int:
+    """Bitmap with bit (block_id - 1) set for every block in block_ids."""
+    bitmap = 0
+    for block_id in block_ids:
+        bitmap |= 1 << (block_id - 1)
+    return bitmap
 
-        # header?
-        if i + 4 > len(raw):
-            print(f"[DEBUG] Incomplete header at pos {i}")
-            break
 
-        block_id, cmd, length = raw[i+1:i+4]
-        packet_end = i + 4 + length + 1
-        if packet_end > len(raw):
-            print(
-                f"[DEBUG] Incomplete packet at pos {i}, need {packet_end - len(raw)} more bytes")
-            break
+def broadcast_with_retry(ser: serial.Serial, decoder: codec.FrameDecoder, block_ids, cmd, build_packet) -> tuple[dict[int, bytes], int]:
+    """
+    Send cmd to every block in block_ids in one broadcast frame and collect their
+    slotted acks, then retry by unicast only the blocks whose ack was missing.
+    build_packet(block_id) builds the frame for a block ID or BROADCAST_ID.
+    Returns ({block_id: payload} for every block that acked, bitmap of the
+    blocks that acked the broadcast).
+    """
+    ser_write(ser, build_packet(cmdc.BROADCAST_ID))
+    acked = read_slotted_replies(ser, decoder, cmd, block_ids)
+    bitmap = ack_bitmap(acked)
 
-        payload = raw[i+4:i+4+length]
-        checksum = raw[i+4+length]
-        full_wo = raw[i:i+4+length]
-        if cks.calc_checksum(full_wo) != checksum:
-            print(
-                f"[DEBUG] Bad checksum at pos {i} (got {checksum:02X}, expected {cks.calc_checksum(full_wo):02X})")
-            i += 1
+    for block_id in block_ids:
+        if block_id in acked:
             continue
+        print(f"[DEBUG] No broadcast ack from block {block_id}, retrying unicast")
+        ser_write(ser, build_packet(block_id))
+        response = read_response(ser, decoder, block_id, cmd)
+        if response:
+            acked[block_id] = response[2]
+    return acked, bitmap
+
+
+async def broadcast_on_lanes(name: str, cmd, build_packet, priority: int = PRIORITY_CONTROL) -> tuple[dict[int, bytes], int]:
+    """broadcast_with_retry() to the active blocks on every bus at once, acks and bitmaps merged."""
+    acked, bitmap = {}, 0
+    for lane_acked, lane_bitmap in await on_lanes(
+            name, lambda ser, decoder, ids: broadcast_with_retry(ser, decoder, ids, cmd, build_packet),
+            active_blocks, priority):
+        acked.update(lane_acked)
+        bitmap |= lane_bitmap
+    return acked, bitmap
+
+
+def ack_results(acked: dict[int, bytes], bitmap: int, ok_status: str) -> dict:
+    results = []
+    for block_id in active_blocks:
+        results.append({
+            "block_id": block_id,
+            "status": ok_status if block_id in acked else "no_response",
+        })
+    return {
+        "results": results,
+        "ack_bitmap": bitmap,
+        "retried": [b for b in active_blocks if not bitmap & (1 << (b - 1))],
+    }
 
-        if block_id != expected_block_id or cmd != expected_cmd:
-            print(
-                f"[DEBUG] Packet at pos {i} not for us (block={block_id}, cmd=0x{cmd:02X})")
-            i += 1
-            continue
 
-        print(f"[DEBUG] Valid response from block {block_id}")
-        return bytes(full_wo) + bytes([checksum])
+def receive_dump_frames(ser: serial.Serial, decoder: codec.FrameDecoder, expected_block_id: int, assembler: codec.DumpAssembler, end_cmds, timeout_seconds: float, rtt_key=None, stop: threading.Event | None = None):
+    """
+    Feed one block's dump frames into the assembler until a zero-length reply
+    to one of end_cmds marks the end of the burst, the capture is complete,
+    timeout_seconds pass without a chunk, or stop is set. Returns the command
+    that ended the burst, or None on completion, timeout or stop. With
+    rtt_key, the time to the block's first frame is fed to the RTT estimator
+    (or a silent block to its backoff).
+    """
+    last_chunk_time = time.monotonic()
+    sent_at = last_chunk_time if rtt_key is not None else None
+    # between chunks, a corrupted chunk's wire time is silence too
+    chunk_gap = 2 * (cmdc.V2_HEADER_LEN + assembler.chunk_size + 2) * 10 / ser.baudrate
+    chunk_count = 0
+    chunk_cmd = cmdc.reply_cmd(cmdc.CMD_DUMP)
+    info_cmd = cmdc.reply_cmd(cmdc.CMD_DUMP_INFO)
+    unchanged_cmd = cmdc.reply_cmd(cmdc.CMD_DUMP_UNCHANGED)
+    end_replies = {cmdc.reply_cmd(cmd): cmd for cmd in end_cmds}
 
-    print("[DEBUG] No valid response frame parsed")
-    return b''
+    while time.monotonic() - last_chunk_time < timeout_seconds + (0 if sent_at is not None else chunk_gap):
+        if stop is not None and stop.is_set():
+            return None
+        if not decoder.read_from(ser):
+            continue
+        for block_id, cmd, payload in decoder.frames():
+            if block_id != expected_block_id:
+                continue
+            if sent_at is not None:
+                rtt.sample(rtt_key, time.monotonic() - sent_at)
+                sent_at = None
+            if cmd == info_cmd:
+                assembler.expect(payload)
+                print(f"Block {expected_block_id} announced {assembler.expected} bytes in {assembler.chunk_count} chunks")
+            elif cmd == chunk_cmd and payload:
+                chunk_count += 1
+                assembler.add(payload)
+                if assembler.complete:
+                    return None  # nothing left to wait for, even if the end marker is lost
+                # Reset timeout for next chunk
+                last_chunk_time = time.monotonic()
+            elif cmd in end_replies and not payload:
+                # Zero-length reply is the ACK packet (end of this burst)
+                return end_replies[cmd]
+            elif cmd == unchanged_cmd and len(payload) >= cmdc.DUMP_TAG_LEN:
+                # the host's copy is still current: this one frame is the whole transfer
+                assembler.tag = struct.unpack_from(cmdc.DUMP_TAG_FMT, payload)
+                assembler.unchanged = True
+                return cmdc.CMD_DUMP
+    if sent_at is not None:
+        rtt.expired(rtt_key)
+    return None
 
 
-def read_exact_bytes(ser: serial.Serial, num_bytes: int, timeout_seconds: float = 1.0) -> bytes:
-    """Read exactly num_bytes from serial port, blocking until complete or timeout."""
-    data = b''
-    start_time = time.time()
+class DumpJob:
+    """
+    Scheduler job that dumps blocks one after another with a sliding window.
+
+    Each step is one bus exchange: the request for a block's first window, an
+    ack asking for the next one, or one selective-repeat round for chunks lost
+    along the way. The block streams a whole window back to back, so the line
+    stays busy, while anything more urgent can use the bus between windows.
+
+    With use_cache, a block whose capture is already on disk is asked with that
+    capture's tag and answers with one CMD_DUMP_UNCHANGED frame if nothing ran
+    since.
+
+    After the first window, the block and the host move to DUMP_BAUD with
+    CMD_BAUD and check it with a ping; windows grow with the rate so they
+    take as long as before. The rate goes back to BAUD when the block is done
+    and whenever another job gets the bus (release()), so every other block
+    and command only ever sees BAUD. A block that fails the switch or loses
+    too many chunks at DUMP_BAUD carries on at BAUD (baud_fallback).
+
+    All state lives on the job, so it can be polled with status() while the
+    scheduler works through it in the background. abort() ends it at the
+    next step, or sooner if that step is waiting for a reply: the current
+    block goes back to BAUD and it and the blocks not reached yet come back
+    as "aborted".
+    """
 
-    while len(data) < num_bytes and (time.time() - start_time) < timeout_seconds:
-        remaining = num_bytes - len(data)
-        chunk = ser.read(remaining)
-        if chunk:
-            data += chunk
+    def __init__(self, block_ids, window_bytes: int = DUMP_WINDOW_BYTES, use_cache: bool = True):
+        self.name = 'dump'
+        self.created = time.time()
+        self.finished = None
+        self.window_bytes = window_bytes
+        self.use_cache = use_cache
+        self.results = []
+        self._final_progress = {}  # block_id -> percent of its capture received, once finished
+        self.writes = []  # dump_writer futures, one per capture handed off
+        self.block_ids = list(block_ids)
+        self._pending = list(block_ids)
+        self._block_id = None
+        self._fast_ser = None  # the port the current block was moved to DUMP_BAUD on
+        self._abort = threading.Event()  # set on the event loop, read on the bus thread
+        self.done = not self._pending
+        self.result = self.results if self.done else None
+
+    def abort(self):
+        """Stop at the next step boundary (or the current reply wait)."""
+        self._abort.set()
+
+    def step(self, ser: serial.Serial, decoder: codec.FrameDecoder):
+        if self._abort.is_set():
+            self._stop(ser, decoder)
+            return
+        if self._block_id is None:
+            self._request(ser, decoder, self._pending.pop(0))
         else:
-            # Small delay to prevent busy waiting
-            time.sleep(0.001)
+            self._raise_rate(ser, decoder)
+            if self._streaming:
+                self._next_window(ser, decoder)
+            else:
+                self._resend_missing(ser, decoder)
+
+        if self._block_id is not None and not self._streaming and self._repaired():
+            result = self._save()
+            result["bus_s"] = round(time.time() - self._start_time, 3)
+            result["baud"] = ser.baudrate if self._fast_ser is ser else BAUD
+            self._lower_rate(ser, decoder)
+            self.results.append(result)
+            self._final_progress[self._block_id] = (100.0 if self._assembler.unchanged or self._complete()
+                                                    else self._assembler.progress)
+            self._block_id = None
+        if self._abort.is_set():
+            self._stop(ser, decoder)
+        elif self._block_id is None and not self._pending:
+            self._finish()
+
+    def _stop(self, ser: serial.Serial, decoder: codec.FrameDecoder):
+        """Give up on the current block and every block not reached yet."""
+        for block_id in ([self._block_id] if self._block_id is not None else []) + self._pending:
+            received = self._assembler.received_bytes if block_id == self._block_id else 0
+            print(f"Block {block_id}: dump aborted")
+            self.results.append({
+                "block_id": block_id,
+                "status": "aborted",
+                "filename": None,
+                "bytes_received": received,
+                "chunks_resent": self._assembler.chunks_requested if block_id == self._block_id else 0,
+                "bus_s": round(time.time() - self._start_time, 3) if block_id == self._block_id else 0.0,
+                "disk_s": 0.0
+            })
+            self._final_progress[block_id] = self._assembler.progress if block_id == self._block_id else 0.0
+        self._lower_rate(ser, decoder)
+        self._block_id = None
+        self._pending = []
+        self._finish()
+
+    def _finish(self):
+        self.result = self.results
+        self.finished = time.time()
+        self.done = True
+
+    def _request(self, ser: serial.Serial, decoder: codec.FrameDecoder, block_id: int):
+        print(f"Requesting dump from block {block_id}...")
+        self._block_id = block_id
+        # v2 blocks send 2 KB chunks; the window stays about the same length in time
+        self._version = protocol_versions.get(block_id, 1)
+        self.window = self._window_at(BAUD)
+        # a block that never answered CMD_PROTOCOL may predate sequenced chunks
+        self._assembler = codec.DumpAssembler(cmdc.dump_chunk_size(self._version),
+                                              accept_unsequenced=self._version == 1)
+        self._start_time = time.time()
+        self._checksum_failures = 0
+        self._idle_windows = 0
+        self._next_seq = self.window
+        self._cached = dump_cache.get(block_id) if self.use_cache else None
+        if self._cached and not os.path.exists(self._cached["filename"]):
+            self._cached = None
+        tag = self._cached["tag"] if self._cached else None
+        ser_write(ser, bld.build_dump_packet(block_id, self.window, self._version, tag))
+        ended_by = self._receive(ser, decoder, cmdc.CMD_DUMP)
+        if (self._assembler.chunk_count is None and self._assembler.received_bytes
+                and not self._assembler.unsequenced):
+            # chunks but no announcement: the info frame was lost, so ask again
+            ser_write(ser, bld.build_dump_packet(block_id, self.window, self._version, tag))
+            ended_by = self._receive(ser, decoder, cmdc.CMD_DUMP)
+        # older firmware streams its whole capture at once; only the end marker says it all came
+        self._stream_ended = ended_by == cmdc.CMD_DUMP
+        # no announcement means no capture (or a block that isn't there, or one that predates it)
+        self._streaming = self._assembler.chunk_count is not None and self._more_to_stream(ended_by)
+
+    def _next_window(self, ser: serial.Serial, decoder: codec.FrameDecoder):
+        received = self._assembler.received_bytes
+        asked = min(self.window, self._assembler.chunk_count - self._next_seq)
+        ser_write(ser, bld.build_dump_ack_packet(self._block_id, self._next_seq, self.window, self._version))
+        ended_by = self._receive(ser, decoder, cmdc.CMD_DUMP_ACK)
+        self._next_seq += self.window
+        print(f"Block {self._block_id}: {self._assembler.progress:.0f}%")
+        # a lost ack or a lost window is repaired later; a silent block is given up on
+        self._idle_windows = self._idle_windows + 1 if self._assembler.received_bytes == received else 0
+        if self._fast_ser is ser:
+            chunk_size = self._assembler.chunk_size
+            got = (self._assembler.received_bytes - received + chunk_size - 1) // chunk_size
+            self._fast_chunks += asked
+            self._fast_lost += max(0, asked - got)
+            if self._idle_windows or (self._fast_chunks >= BAUD_ERROR_MIN_CHUNKS
+                                      and self._fast_lost > BAUD_MAX_LOSS * self._fast_chunks):
+                print(f"Block {self._block_id}: lost {self._fast_lost} of {self._fast_chunks} chunks "
+                      f"at {DUMP_BAUD} baud, falling back to {BAUD}")
+                baud_fallback.add(self._block_id)
+                self._lower_rate(ser, decoder)
+                self._idle_windows = 0  # BAUD gets its own chances
+        self._streaming = self._idle_windows < MAX_IDLE_WINDOWS and self._more_to_stream(ended_by)
+
+    def release(self, ser: serial.Serial, decoder: codec.FrameDecoder):
+        """Another job wants the bus: put the block back at BAUD until the next step."""
+        self._lower_rate(ser, decoder)
+
+    def _window_at(self, rate: int) -> int:
+        """Chunks per window at rate: the window takes as long on the wire as window_bytes at BAUD."""
+        return max(1, self.window_bytes * rate // BAUD // cmdc.dump_chunk_size(self._version))
+
+    def _raise_rate(self, ser: serial.Serial, decoder: codec.FrameDecoder):
+        """Move the current block and the host to DUMP_BAUD, unless already there or it failed before."""
+        block_id = self._block_id
+        if (self._fast_ser is ser or DUMP_BAUD <= BAUD or block_id in baud_fallback
+                or self._assembler.unchanged or not self._assembler.received_bytes):
+            return
+        ser_write(ser, bld.build_baud_packet(block_id, DUMP_BAUD, BAUD_REVERT_MS, self._version))
+        # a lost ack doesn't mean the block stayed behind: the ping below tells
+        read_response(ser, decoder, block_id, cmdc.CMD_BAUD)
+        self._fast_ser = ser
+        self._set_host_rate(ser, decoder, DUMP_BAUD)
+        if self._ping(ser, decoder) or self._ping(ser, decoder):
+            self.window = self._window_at(DUMP_BAUD)
+            self._fast_chunks = self._fast_lost = 0
+            return
+        # firmware without CMD_BAUD, or a line that can't carry the rate
+        print(f"Block {block_id}: no ping at {DUMP_BAUD} baud, dumping at {BAUD}")
+        baud_fallback.add(block_id)
+        self._lower_rate(ser, decoder)
+
+    def _lower_rate(self, ser: serial.Serial, decoder: codec.FrameDecoder):
+        """Put the current block and the host back at BAUD."""
+        if self._fast_ser is None:
+            return
+        reopened = self._fast_ser is not ser  # a new port starts at BAUD; the block reverts when idle
+        self._fast_ser = None
+        if self._block_id is not None:
+            self.window = self._window_at(BAUD)
+        if reopened:
+            return
+        ser_write(ser, bld.build_baud_packet(self._block_id, 0, BAUD_REVERT_MS, self._version))
+        acked = read_response(ser, decoder, self._block_id, cmdc.CMD_BAUD,
+                              time.monotonic() + reply_timeout(self._block_id, cmdc.CMD_BAUD))
+        self._set_host_rate(ser, decoder, BAUD)
+        if not acked and not self._ping(ser, decoder):
+            # the block didn't hear it: wait out its own fallback, plus one read_packet() poll
+            time.sleep((BAUD_REVERT_MS + 100) / 1000)
+
+    @staticmethod
+    def _set_host_rate(ser: serial.Serial, decoder: codec.FrameDecoder, rate: int):
+        ser.baudrate = rate
+        ser.reset_input_buffer()  # whatever came in at the old rate is noise now
+        decoder.clear()
+
+    def _ping(self, ser: serial.Serial, decoder: codec.FrameDecoder) -> bool:
+        """Check the current block hears the host at the host's rate."""
+        ser_write(ser, bld.build_ping_packet(self._block_id))
+        # a fixed deadline: a miss here says nothing about the block's usual ping time
+        return read_response(ser, decoder, self._block_id, cmdc.CMD_PING,
+                             time.monotonic() + reply_timeout(self._block_id, cmdc.CMD_PING)) is not None
+
+    def progress(self) -> dict[int, float]:
+        """Percent of each block's capture received; blocks not started yet are at 0."""
+        progress = dict(self._final_progress)
+        if self._block_id is not None:
+            progress[self._block_id] = self._assembler.progress
+        return {block_id: progress.get(block_id, 0.0) for block_id in self.block_ids}
+
+    def status(self) -> dict:
+        """Progress and throughput per block so far; finished blocks carry their result."""
+        progress = self.progress()
+        finished = {r["block_id"]: r for r in self.results}
+        blocks = []
+        for block_id in self.block_ids:
+            entry = {"block_id": block_id, "progress": round(progress[block_id], 1)}
+            if block_id in finished:
+                r = finished[block_id]
+                entry.update(r, throughput_kbps=round(r["bytes_received"] / r["bus_s"] / 1024, 1)
+                             if r["bus_s"] else 0.0)
+            elif block_id == self._block_id:
+                elapsed = time.time() - self._start_time
+                received = self._assembler.received_bytes
+                entry.update(status="in_progress", bytes_received=received,
+                             throughput_kbps=round(received / elapsed / 1024, 1) if elapsed else 0.0)
+            else:
+                entry["status"] = "queued"
+            blocks.append(entry)
+        return {
+            "state": ("writing" if not self.written else "done") if self.done else "running",
+            "elapsed_s": round((self.finished or time.time()) - self.created, 3),
+            "blocks": blocks,
+        }
 
-    return data
+    @property
+    def written(self) -> bool:
+        """True once every capture handed to the writer is on disk (or failed to get there)."""
+        return all(f.done() for f in self.writes)
+
+    async def flush(self):
+        """Wait for the writer to finish this job's captures."""
+        await asyncio.gather(*(asyncio.wrap_future(f) for f in self.writes))
+
+    def _more_to_stream(self, ended_by) -> bool:
+        return (ended_by != cmdc.CMD_DUMP and not self._assembler.complete
+                and self._next_seq < self._assembler.chunk_count)
+
+    def _complete(self) -> bool:
+        """Every byte is in: as announced, or up to the end marker of an unsequenced stream."""
+        return self._assembler.complete or (self._assembler.unsequenced and self._stream_ended)
+
+    def _repaired(self) -> bool:
+        """True once there is nothing left to ask for again (nothing can be, without sequence numbers)."""
+        return (self._assembler.complete or not self._assembler.received_bytes or self._assembler.unsequenced
+                or self._assembler.resend_rounds >= MAX_RESEND_ROUNDS)
+
+    def _resend_missing(self, ser: serial.Serial, decoder: codec.FrameDecoder):
+        """One selective-repeat round: ask for the missing chunk ranges only."""
+        missing = self._assembler.missing_ranges()[:cmdc.DUMP_RESEND_MAX_RANGES]
+        self._assembler.resend_rounds += 1
+        self._assembler.chunks_requested += sum(count for _, count in missing)
+        print(f"Block {self._block_id}: requesting {len(missing)} missing ranges again")
+        ser_write(ser, bld.build_dump_resend_packet(self._block_id, missing, self._version))
+        self._receive(ser, decoder, cmdc.CMD_DUMP_RESEND, (cmdc.CMD_DUMP_RESEND,))
+
+    def _receive(self, ser: serial.Serial, decoder: codec.FrameDecoder, request_cmd: int,
+                 end_cmds=(cmdc.CMD_DUMP_ACK, cmdc.CMD_DUMP)):
+        """Receive the reply burst to request_cmd, waiting as long as its measured RTT allows."""
+        failures_before = decoder.bad_checksums
+        ended_by = receive_dump_frames(ser, decoder, self._block_id, self._assembler, end_cmds,
+                                       reply_timeout(self._block_id, request_cmd), (self._block_id, request_cmd),
+                                       self._abort)
+        self._checksum_failures += decoder.bad_checksums - failures_before
+        return ended_by
+
+    def _save(self) -> dict:
+        """
+        Hand the finished block's capture to the writer thread for
+        block_{id}_dump.bin and return its result; the writer fills in the
+        final status and disk_s once the file is synced.
+        """
+        block_id = self._block_id
+        assembler = self._assembler
+        duration = time.time() - self._start_time
+        file_data = assembler.data()
+
+        if self._checksum_failures > 0:
+            print(
+                f"Block {block_id}: {self._checksum_failures} checksum failures detected, {assembler.chunks_requested} chunks resent")
+        if assembler.unchanged:
+            print(f"Block {block_id}: run {assembler.tag[0]} unchanged, keeping {self._cached['filename']}")
+            return {
+                "block_id": block_id,
+                "status": "not_modified",
+                "filename": self._cached["filename"],
+                "bytes_received": 0,
+                "chunks_resent": 0,
+                "run_id": assembler.tag[0],
+                "disk_s": 0.0
+            }
+        if not assembler.received_bytes:
+            print(f"Block {block_id}: No data received in {duration:.2f}s")
+            return {
+                "block_id": block_id,
+                "status": "no_data_received",
+                "filename": None,
+                "bytes_received": 0,
+                "chunks_resent": assembler.chunks_requested,
+                "disk_s": 0.0
+            }
+        if not self._complete():
+            print(
+                f"Block {block_id}: incomplete dump, {assembler.received_bytes} of {assembler.expected if assembler.expected is not None else '?'} bytes")
+
+        # Calculate throughput
+        throughput = len(file_data) / duration / 1024  # KB/s
+        print(
+            f"Block {block_id}: {len(file_data)} bytes in {duration:.2f}s on the bus ({throughput:.1f} KB/s)")
+
+        filename = f"block_{block_id}_dump.bin"
+        update_dump_cache(block_id, None)  # the file is about to change
+        result = {
+            "block_id": block_id,
+            "status": "success" if self._complete() else "incomplete",
+            "filename": filename,
+            "bytes_received": assembler.received_bytes,
+            "chunks_resent": assembler.chunks_requested,
+            "run_id": assembler.tag[0] if assembler.tag else None,
+            "gun_timestamp": assembler.gun_timestamp,
+            "rt_timestamp": assembler.rt_timestamp,
+            "disk_s": None
+        }
+        # the next block starts transmitting while this one is written
+        self.writes.append(dump_writer.submit(write_capture, result, file_data, assembler.tag))
+        return result
 
 
-def read_dump_chunks(ser: serial.Serial, expected_block_id: int, timeout_seconds: float = 3.0) -> bytes:
-    """Read all chunks from a block's dump response and return the complete binary data."""
-    file_data = b''
-    start_time = time.time()
-    chunk_count = 0
-    checksum_failures = 0
-    incomplete_reads = 0
-    wrong_packets = 0
-
-    while time.time() - start_time < timeout_seconds:
-        if ser.read(1) == bytes([cmdc.STX]):
-            # Read header with blocking read
-            header = read_exact_bytes(ser, 3, 1.0)
-            if not header or len(header) < 3:
-                incomplete_reads += 1
-                print(f"Incomplete header read (got {len(header)} bytes)")
-                continue
+def write_capture(result: dict, file_data: bytearray, tag):
+    """
+    Writer thread: save a capture through a temporary file, fsync it and
+    rename it into place, then check it against its tag. Updates result's
+    status and disk_s in place.
+    """
+    filename = result["filename"]
+    start = time.monotonic()
+    try:
+        temp = filename + '.part'
+        with open(temp, "wb") as f:
+            f.write(file_data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp, filename)  # readers never see a half-written capture
+    except OSError as e:
+        result["status"] = f"file_write_error: {str(e)}"
+    result["disk_s"] = round(time.monotonic() - start, 3)
+    print(f"Saved {len(file_data)} bytes to {filename} in {result['disk_s'] * 1000:.1f} ms")
+    if result["status"] == "success" and tag:
+        # whole-file check on top of the per-frame ones before trusting the copy
+        if zlib.crc32(file_data) == tag[1]:
+            update_dump_cache(result["block_id"], {"tag": tag, "filename": filename, "bytes": len(file_data)})
+        else:
+            result["status"] = "crc_mismatch"
 
-            block_id, cmd, length = header
 
-            # Check if this is the expected block and command
-            if block_id != expected_block_id or cmd != cmdc.reply_cmd(cmdc.CMD_DUMP):
-                wrong_packets += 1
-                print(
-                    f"Wrong packet: block_id={block_id} (expected {expected_block_id}), cmd={cmd} (expected {cmdc.CMD_DUMP})")
+def update_dump_cache(block_id: int, entry: dict | None):
+    """Set a block's dump_cache entry, or drop it for None, and save the cache to DUMP_CACHE_FILE."""
+    with dump_cache_lock:
+        if entry is None:
+            if dump_cache.pop(block_id, None) is None:
+                return
+        else:
+            dump_cache[block_id] = entry
+        entries = {str(cached_id): cached for cached_id, cached in dump_cache.items()}
+        try:
+            temp = DUMP_CACHE_FILE + '.part'
+            with open(temp, "w") as f:
+                json.dump(entries, f, indent=2)
+            os.replace(temp, DUMP_CACHE_FILE)
+        except OSError as e:
+            print(f"Could not save {DUMP_CACHE_FILE}: {e}")
+
+
+def load_dump_cache() -> dict[int, dict]:
+    """dump_cache from DUMP_CACHE_FILE, leaving out captures no longer on disk at their saved size."""
+    try:
+        with open(DUMP_CACHE_FILE) as f:
+            entries = json.load(f)
+        cache = {int(block_id): {"tag": tuple(entry["tag"]), "filename": entry["filename"], "bytes": entry["bytes"]}
+                 for block_id, entry in entries.items()}
+    except (OSError, ValueError, KeyError, TypeError):
+        return {}
+    for block_id, entry in list(cache.items()):
+        try:
+            if os.path.getsize(entry["filename"]) == entry["bytes"]:
                 continue
+        except OSError:
+            pass
+        print(f"Block {block_id}: cached capture {entry['filename']} gone or changed, will dump it again")
+        del cache[block_id]
+    return cache
 
-            # If length is 0, this is the ACK packet (end of transmission)
-            if length == 0:
-                print(f"Received ACK packet from block {expected_block_id}")
-                # Read and verify checksum for the ACK packet
-                checksum = read_exact_bytes(ser, 1, 1.0)
-                full = bytes([cmdc.STX]) + header
-                if checksum and len(checksum) == 1 and checksum[0] == cks.calc_checksum(full):
-                    if checksum_failures > 0:
-                        print(
-                            f"Block {expected_block_id}: {checksum_failures} checksum failures detected")
-                    break
-                else:
-                    print(
-                        f"ACK checksum invalid: got {checksum[0] if checksum and len(checksum) > 0 else 'None'}, expected {cks.calc_checksum(full)}")
-                continue
 
-            # Read the chunk payload with blocking read
-            payload = read_exact_bytes(ser, length, 2.0)
-            if not payload or len(payload) != length:
-                incomplete_reads += 1
-                print(
-                    f"Incomplete payload read: got {len(payload) if payload else 0} bytes, expected {length}")
-                continue
+class MultiBusDump:
+    """
+    One dump of blocks spread over several buses: a DumpJob per lane, each on
+    its own scheduler so the buses transfer at the same time, polled and
+    reported as a single job.
+    """
 
-            # Read and verify checksum with blocking read
-            checksum = read_exact_bytes(ser, 1, 1.0)
-            full = bytes([cmdc.STX]) + header + payload
-            expected_checksum = cks.calc_checksum(full)
+    def __init__(self, block_ids, use_cache: bool = True, trigger: str = 'request'):
+        self.id = str(next(_dump_job_ids))
+        self.trigger = trigger  # 'request', or 'prefetch' when started by the end of a run
+        self.created = time.time()
+        self.parts = [(lane, DumpJob(ids, use_cache=use_cache)) for lane, ids in group_by_lane(block_ids)]
+        self.block_ids = [block_id for _, job in self.parts for block_id in job.block_ids]
+
+    async def run(self) -> list[dict]:
+        """Queue every lane's job and wait until all of them are done with the bus."""
+        await asyncio.gather(*(lane.scheduler.submit(job, PRIORITY_BULK) for lane, job in self.parts))
+        return self.results
+
+    @property
+    def done(self) -> bool:
+        return all(job.done for _, job in self.parts)
+
+    @property
+    def written(self) -> bool:
+        return all(job.written for _, job in self.parts)
+
+    @property
+    def results(self) -> list[dict]:
+        return sorted((r for _, job in self.parts for r in job.results), key=lambda r: r["block_id"])
+
+    async def flush(self):
+        await asyncio.gather(*(job.flush() for _, job in self.parts))
+
+    def abort(self):
+        for _, job in self.parts:
+            job.abort()
+
+    def status(self) -> dict:
+        parts = [(lane, job.status()) for lane, job in self.parts]
+        finished = max((job.finished for _, job in self.parts if job.finished), default=self.created)
+        return {
+            "job_id": self.id,
+            "trigger": self.trigger,
+            "state": ("writing" if not self.written else "done") if self.done else "running",
+            "elapsed_s": round((finished if self.done else time.time()) - self.created, 3),
+            "blocks": sorted((b for _, part in parts for b in part["blocks"]), key=lambda b: b["block_id"]),
+            "buses": [{"bus": lane.name, "port": lane.port, "state": part["state"], "elapsed_s": part["elapsed_s"]}
+                      for lane, part in parts],
+        }
 
-            if checksum and len(checksum) == 1 and checksum[0] == expected_checksum:
-                chunk_count += 1
-                file_data += payload
-                if chunk_count % 50 == 0:  # Log every 50th chunk to reduce spam
-                    print(
-                        f"Chunk {chunk_count}: {length} bytes received (total: {len(file_data)} bytes)")
-                # Reset timeout for next chunk
-                start_time = time.time()
-            else:
-                checksum_failures += 1
-                if checksum_failures <= 5:  # Only show first 5 failures to avoid spam
-                    actual_checksum = checksum[0] if checksum and len(
-                        checksum) > 0 else None
-                    print(
-                        f"Block {expected_block_id}: Checksum failure #{checksum_failures} - got {actual_checksum}, expected {expected_checksum}")
 
-    return file_data
+def dump_block(ser: serial.Serial, decoder: codec.FrameDecoder, block_id: int) -> dict:
+    """Dump one block's capture in a single bus transaction and save it to block_{id}_dump.bin."""
+    job = DumpJob([block_id])
+    while not job.done:
+        job.step(ser, decoder)
+    for write in job.writes:
+        write.result()
+    return job.result[0]
 
 
-def dump_all_blocks():
-    """Send dump command to all blocks and save received files."""
+async def dump_all_blocks(force: bool = False):
+    """Send dump command to all blocks and save received files; force re-pulls captures already on disk."""
     abort_pin.off()
-    results = []
+    if not active_blocks:
+        return 'No Active Blocks'
+    # One job per bus, all at once; one step per window, so urgent requests can run in between
+    dump = MultiBusDump(active_blocks, use_cache=not force)
+    foreground_dumps.add(dump)
+    try:
+        results = await dump.run()
+    finally:
+        foreground_dumps.discard(dump)
+    await dump.flush()  # report once the files are on disk
+    return results
 
-    with open_rs485() as ser:
-        if not active_blocks:
-            return 'No Active Blocks'
-        for block_id in active_blocks:
-            print(f"Requesting dump from block {block_id}...")
-
-            # Start timer
-            start_time = time.time()
-
-            # Send dump command
-            pkt = bld.build_dump_packet(block_id)
-            ser_write(ser, pkt)
-
-            # Start reading file chunks immediately (no ACK wait needed)
-            # The block sends data first, then ACK
-            file_data = read_dump_chunks(ser, block_id)
-
-            # End timer and calculate duration
-            end_time = time.time()
-            duration = end_time - start_time
-
-            if file_data:
-                # Calculate throughput
-                throughput = len(file_data) / duration / 1024  # KB/s
-                print(
-                    f"Block {block_id}: {len(file_data)} bytes in {duration:.2f}s ({throughput:.1f} KB/s)")
-
-                # Save to file
-                filename = f"block_{block_id}_dump.bin"
-                try:
-                    with open(filename, "wb") as f:
-                        f.write(file_data)
-
-                    results.append({
-                        "block_id": block_id,
-                        "status": "success",
-                        "filename": filename,
-                        "bytes_received": len(file_data)
-                    })
-                    print(f"Saved {len(file_data)} bytes to {filename}")
-
-                except IOError as e:
-                    results.append({
-                        "block_id": block_id,
-                        "status": f"file_write_error: {str(e)}",
-                        "filename": filename,
-                        "bytes_received": len(file_data)
-                    })
-            else:
-                print(f"Block {block_id}: No data received in {duration:.2f}s")
-                results.append({
-                    "block_id": block_id,
-                    "status": "no_data_received",
-                    "filename": None,
-                    "bytes_received": 0
-                })
 
-        time.sleep(0.1)  # Small delay between blocks
-    return results
+def start_dump_job(force: bool = False, block_ids=None, trigger: str = 'request') -> MultiBusDump | None:
+    """Queue a dump of all active blocks (or block_ids) on the scheduler and return without waiting for it."""
+    abort_pin.off()
+    block_ids = active_blocks if block_ids is None else block_ids
+    if not block_ids:
+        return None
+    job = MultiBusDump(block_ids, use_cache=not force, trigger=trigger)
+    dump_jobs[job.id] = (job, asyncio.create_task(job.run()))
+    finished = [job_id for job_id, (_, task) in dump_jobs.items() if task.done()]
+    for job_id in finished[:max(0, len(finished) - DUMP_JOB_HISTORY)]:
+        del dump_jobs[job_id]
+    return job
+
+
+STATE_NAMES = {
+    cmdc.STATE_IDLE: "idle",
+    cmdc.STATE_ARMED: "armed",
+    cmdc.STATE_LOGGING: "logging",
+    cmdc.STATE_FINISHED: "finished",
+}
+
+
+def parse_status(payload: bytes) -> dict | None:
+    """Decode a CMD_STATUS reply; None if it is too short."""
+    if len(payload) < cmdc.STATUS_LEN:
+        return None
+    state, run_id, samples, interrupts, lost, rollovers, mem_free, capture = struct.unpack_from(cmdc.STATUS_FMT, payload)
+    return {
+        "state": STATE_NAMES.get(state, f"unknown_{state}"),
+        "run_id": run_id,
+        "samples": samples,
+        "int_counter": interrupts,
+        "lost_packets": lost,
+        "ts_rollovers": rollovers,
+        "mem_free": mem_free,
+        "capture_bytes": capture,
+    }
 
 
+def poll_status(ser: serial.Serial, decoder: codec.FrameDecoder, block_ids) -> dict[int, dict]:
+    """One broadcast CMD_STATUS and no retries: {block_id: status} for every block that answered in its slot."""
+    ser_write(ser, bld.build_status_packet(cmdc.BROADCAST_ID))
+    statuses = {}
+    for block_id, payload in read_slotted_replies(ser, decoder, cmdc.CMD_STATUS, block_ids).items():
+        status = parse_status(payload)
+        if status is not None:
+            statuses[block_id] = block_status[block_id] = status
+    return statuses
+
+
+def poll_run_finished(ser: serial.Serial, decoder: codec.FrameDecoder, block_ids) -> list[int]:
+    """
+    Blocks still inside start_loop() aren't listening, so the ones that answer
+    CMD_STATUS are done; blocks that never answered it (older firmware) get a
+    broadcast ping instead.
+    """
+    finished = list(poll_status(ser, decoder, block_ids))
+    legacy = [block_id for block_id in block_ids if block_id not in finished and block_id not in block_status]
+    if legacy:
+        ser_write(ser, bld.build_ping_packet(cmdc.BROADCAST_ID))
+        finished += read_slotted_replies(ser, decoder, cmdc.CMD_PING, legacy)
+    return finished
+
+
+async def prefetch_after_run(block_ids, generation: int):
+    """
+    Wait for every block in the run to come back from start_loop(), then dump
+    them in the background. Returns without dumping once a later /set has
+    started another run (prefetch_generation moved on).
+    """
+    deadline = time.monotonic() + RUN_MAX_S
+    finished = {}
+    while len(finished) < len(block_ids) and time.monotonic() < deadline:
+        await asyncio.sleep(RUN_POLL_INTERVAL)
+        if generation != prefetch_generation:
+            return
+        waiting = [block_id for block_id in block_ids if block_id not in finished]
+        for lane_finished in await on_lanes('run_poll', poll_run_finished, waiting):
+            for block_id in lane_finished:
+                finished[block_id] = time.monotonic()
+    if generation != prefetch_generation:
+        return
+    if len(finished) < len(block_ids):
+        print(f"Prefetch: blocks {[b for b in block_ids if b not in finished]} still running after {RUN_MAX_S}s")
+    # a block whose status shows an empty capture has nothing to pull
+    to_dump = [b for b in sorted(finished) if block_status.get(b, {}).get("capture_bytes", 1)]
+    job = start_dump_job(block_ids=to_dump, trigger='prefetch')
+    if job is not None:
+        print(f"Prefetch: run over, dump job {job.id} started for blocks {job.block_ids}")
+
+
+def start_prefetch():
+    """
+    (Re)start watching for the end of the run that /set just started. An
+    earlier watcher isn't cancelled, as it may be in the middle of a bus
+    transaction; it sees the new generation and stops between polls.
+    """
+    global prefetch_task, prefetch_generation
+    prefetch_generation += 1
+    prefetch_task = (asyncio.create_task(prefetch_after_run(list(active_blocks), prefetch_generation))
+                     if active_blocks else None)
+
+
+def dump_summary(results: list[dict]) -> dict:
+    successful_dumps = [r for r in results if r["status"] in ("success", "not_modified")]
+    return {
+        "total_blocks": len(results),
+        "successful_dumps": len(successful_dumps),
+        "unchanged_dumps": sum(1 for r in results if r["status"] == "not_modified"),
+        "failed_dumps": len(results) - len(successful_dumps),
+        "total_bytes_received": sum(r["bytes_received"] for r in results),
+        "bus_s": round(sum(r.get("bus_s", 0.0) for r in results), 3),
+        "disk_s": round(sum(r["disk_s"] or 0.0 for r in results), 3)
+    }
+
+
+def percentile(ordered: list[float], q: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+class LinkTestJob:
+    """
+    Scheduler job that qualifies a bus: `count` CMD_ECHO exchanges per block,
+    LINKTEST_BURST of them per step. Every reply byte is checked against
+    codec.echo_pattern(), so a lane that corrupts data shows up in the frame
+    error rate and one that is merely slow in the round-trip times.
+    """
+
+    def __init__(self, block_ids, count: int = LINKTEST_COUNT, size: int = LINKTEST_SIZE):
+        self.name = 'linktest'
+        self.block_ids = list(block_ids)
+        self.count = count
+        self.size = size
+        self._stats = {block_id: {"sent": 0, "ok": 0, "lost": 0, "corrupt": 0, "late": 0,
+                                  "bad_checksums": 0, "bytes": 0, "bus_s": 0.0, "rtts": []}
+                       for block_id in self.block_ids}
+        self._pending = [(block_id, first) for block_id in self.block_ids
+                         for first in range(0, count, LINKTEST_BURST)]
+        self.done = not self._pending
+        self.result = self.results() if self.done else None
+
+    def step(self, ser: serial.Serial, decoder: codec.FrameDecoder):
+        block_id, first = self._pending.pop(0)
+        for seq in range(first, min(first + LINKTEST_BURST, self.count)):
+            self._echo(ser, decoder, block_id, seq)
+        if not self._pending:
+            self.result = self.results()
+            self.done = True
+
+    def _echo(self, ser: serial.Serial, decoder: codec.FrameDecoder, block_id: int, seq: int):
+        stats = self._stats[block_id]
+        version = protocol_versions.get(block_id, 1)
+        size = min(self.size, cmdc.max_payload(version) - cmdc.ECHO_REPLY_LEN)
+        expected = struct.pack(cmdc.ECHO_REPLY_FMT, seq) + codec.echo_pattern(seq, size)
+        reply = cmdc.reply_cmd(cmdc.CMD_ECHO)
+        failures = decoder.bad_checksums
+        sent_at = time.monotonic()
+        ser_write(ser, bld.build_echo_packet(block_id, seq, size, version))
+        # a fixed deadline, stretched by the reply's own wire time
+        deadline = sent_at + TIMEOUT + (size + codec.FRAME_OVERHEAD_V2 + cmdc.ECHO_REPLY_LEN) * 10 / ser.baudrate
+        outcome = "lost"
+        while outcome == "lost":
+            frame = read_one_packet(ser, decoder, deadline)
+            if frame is None:
+                break
+            frame_block, cmd, payload = frame
+            if frame_block != block_id or cmd != reply:
+                continue
+            if payload[:cmdc.ECHO_REPLY_LEN] != expected[:cmdc.ECHO_REPLY_LEN]:
+                stats["late"] += 1  # answer to an earlier echo that missed its deadline
+                continue
+            outcome = "ok" if payload == expected else "corrupt"
+        elapsed = time.monotonic() - sent_at
+        stats["sent"] += 1
+        stats[outcome] += 1
+        stats["bus_s"] += elapsed
+        stats["bad_checksums"] += decoder.bad_checksums - failures
+        if outcome == "ok":
+            stats["rtts"].append(elapsed)
+            stats["bytes"] += size
+
+    def results(self) -> list[dict]:
+        """Per block: outcome counts, frame error rate, RTT percentiles and goodput."""
+        results = []
+        for block_id in self.block_ids:
+            stats = self._stats[block_id]
+            rtts = sorted(stats["rtts"])
+            results.append({
+                "block_id": block_id,
+                "status": "ok" if rtts else "no_response",
+                "echoes": stats["sent"],
+                "ok": stats["ok"],
+                "lost": stats["lost"],
+                "corrupt": stats["corrupt"],
+                "late": stats["late"],
+                "bad_checksums": stats["bad_checksums"],
+                "frame_error_rate": round((stats["lost"] + stats["corrupt"]) / stats["sent"], 4) if stats["sent"] else None,
+                "rtt_ms": {name: round(percentile(rtts, q) * 1000, 2)
+                           for name, q in (("min", 0.0), ("p50", 0.5), ("p95", 0.95), ("p99", 0.99), ("max", 1.0))}
+                if rtts else None,
+                "bytes_received": stats["bytes"],
+                "bus_s": round(stats["bus_s"], 3),
+                "goodput_kbps": round(stats["bytes"] / stats["bus_s"] / 1024, 1) if stats["bus_s"] else 0.0,
+            })
+        return results
+
+
+def discover_blocks(ser: serial.Serial, decoder: codec.FrameDecoder, sweep: bool, block_ids=BLOCK_IDS) -> list[int]:
+    """Blocks on this bus that answer a ping; a broadcast also finds blocks outside block_ids."""
+    if sweep:
+        found = []
+        for block_id in block_ids:
+            ser_write(ser, bld.build_ping_packet(block_id))
+            if read_response(ser, decoder, block_id, cmdc.CMD_PING):
+                found.append(block_id)
+        return found
+
+    ser_write(ser, bld.build_ping_packet(cmdc.BROADCAST_ID))
+    return sorted(read_slotted_replies(ser, decoder, cmdc.CMD_PING, block_ids))
+
+
+def negotiate_protocol(ser: serial.Serial, decoder: codec.FrameDecoder, block_ids) -> dict[int, int]:
+    """
+    Ask every block for the highest frame version it speaks, with one broadcast.
+    Blocks that stay silent predate CMD_PROTOCOL and keep getting v1 frames.
+    """
+    if not block_ids:
+        return {}
+    ser_write(ser, bld.build_protocol_packet(cmdc.BROADCAST_ID))
+    replies = read_slotted_replies(ser, decoder, cmdc.CMD_PROTOCOL, block_ids)
+    versions = {}
+    for block_id in block_ids:
+        payload = replies.get(block_id)
+        versions[block_id] = min(payload[0], cmdc.PROTOCOL_VERSION) if payload else 1
+    return versions
 
 
 @app.post('/ping')
-def ping_all_blocks():
-    global active_blocks
+async def ping_all_blocks(sweep: bool = False):
+    """
+    Discover active blocks with one broadcast ping; each block answers in its
+    own slot. sweep=true pings every ID in turn instead, for firmware that
+    predates broadcast discovery. The blocks found are then asked which frame
+    version they speak. Every bus is searched at once; each block is then
+    addressed on the bus it answered on.
+    """
+    global active_blocks, protocol_versions, block_lanes
     abort_pin.off()
-    active_blocks = []
     results = []
 
-    with open_rs485() as ser:
-        for block_id in BLOCK_IDS:
-            print(f"\n[DEBUG] === PINGING BLOCK {block_id} ===")
-            pkt = bld.build_ping_packet(block_id)
-            debug_packet(pkt, f"SENDING to block {block_id}")
-            ser_write(ser, pkt)
-
-            response = read_response(ser, block_id, cmdc.CMD_PING)
-            if response:
-                debug_packet(response, f"RECEIVED from block {block_id}")
-                active_blocks.append(block_id)
-                results.append({
-                    "block_id": block_id,
-                    "status": "ok",
-                })
-            else:
-                print(f"[DEBUG] No response received from block {block_id}")
-                results.append({
-                    "block_id": block_id,
-                    "status": "no_response"
-                })
+    def discover(ser, decoder, block_ids):
+        found = discover_blocks(ser, decoder, sweep, block_ids)
+        return found, negotiate_protocol(ser, decoder, found)
 
+    versions = {}
+    found_on = {}
+    for lane, (lane_found, lane_versions) in zip(lanes, await on_lanes('ping', discover)):
+        for block_id in lane_found:
+            if block_id in found_on:
+                print(f"[DEBUG] Block {block_id} answered on {lane.port} and {found_on[block_id].port}, keeping the first")
+                continue
+            if block_id not in lane.block_ids:
+                print(f"[DEBUG] Block {block_id} answered on {lane.port}, not where the topology puts it")
+            found_on[block_id] = lane
+            versions[block_id] = lane_versions[block_id]
+    found = sorted(found_on)
+
+    for block_id in BLOCK_IDS:
+        if block_id in found:
+            results.append({
+                "block_id": block_id,
+                "status": "ok",
+                "protocol": versions[block_id],
+                "bus": found_on[block_id].name,
+            })
+        else:
+            print(f"[DEBUG] No response received from block {block_id}")
+            results.append({
+                "block_id": block_id,
+                "status": "no_response"
+            })
+
+    active_blocks = found
+    protocol_versions = versions
+    baud_fallback.clear()  # a block swapped or fixed since gets DUMP_BAUD again
+    block_lanes = found_on
+    save_topology()
     print("active", active_blocks)
     return {"results": results}
 
 
+def save_topology():
+    """Write the active blocks with their bus and protocol version to TOPOLOGY_CACHE."""
+    blocks = {str(block_id): {"port": lane_of(block_id).port, "bus": lane_of(block_id).name,
+                              "protocol": protocol_versions.get(block_id, 1)}
+              for block_id in active_blocks}
+    try:
+        temp = TOPOLOGY_CACHE + '.part'
+        with open(temp, "w") as f:
+            json.dump({"saved": time.time(), "blocks": blocks}, f, indent=2)
+        os.replace(temp, TOPOLOGY_CACHE)
+    except OSError as e:
+        print(f"Could not save {TOPOLOGY_CACHE}: {e}")
+
+
+def load_topology() -> dict[int, dict]:
+    """{block_id: {"port", "bus", "protocol"}} from TOPOLOGY_CACHE, empty if there is none."""
+    try:
+        with open(TOPOLOGY_CACHE) as f:
+            return {int(block_id): info for block_id, info in json.load(f)["blocks"].items()}
+    except (OSError, ValueError, KeyError, TypeError):
+        return {}
+
+
+def check_known_blocks(ser: serial.Serial, decoder: codec.FrameDecoder, known: dict[int, int]) -> dict[int, int]:
+    """
+    Check that the cached blocks on this bus ({block_id: cached protocol}) are
+    still there; returns {block_id: protocol} of those that are. A CMD_PROTOCOL
+    broadcast answers both questions at once for blocks cached as v2 (firmware
+    that was rolled back stays silent and falls through to the ping), a ping
+    broadcast covers v1 ones. Blocks that miss their slot are asked by unicast.
+    """
+    versions = {}
+    newer = [block_id for block_id, version in known.items() if version >= 2]
+    if newer:
+        ser_write(ser, bld.build_protocol_packet(cmdc.BROADCAST_ID))
+        for block_id, payload in read_slotted_replies(ser, decoder, cmdc.CMD_PROTOCOL, newer).items():
+            if block_id in known and payload:
+                versions[block_id] = min(payload[0], cmdc.PROTOCOL_VERSION)
+    older = [block_id for block_id in known if block_id not in newer]
+    if older:
+        ser_write(ser, bld.build_ping_packet(cmdc.BROADCAST_ID))
+        for block_id in read_slotted_replies(ser, decoder, cmdc.CMD_PING, older):
+            if block_id in known:
+                versions[block_id] = 1
+    for block_id in known:
+        if block_id in versions:
+            continue
+        if block_id in newer:
+            ser_write(ser, bld.build_protocol_packet(block_id))
+            response = read_response(ser, decoder, block_id, cmdc.CMD_PROTOCOL)
+            if response and response[2]:
+                versions[block_id] = min(response[2][0], cmdc.PROTOCOL_VERSION)
+                continue
+        ser_write(ser, bld.build_ping_packet(block_id))
+        if read_response(ser, decoder, block_id, cmdc.CMD_PING):
+            versions[block_id] = 1
+    return versions
+
+
+async def restore_topology():
+    """Startup: take the blocks from TOPOLOGY_CACHE that still answer, without a full /ping."""
+    global active_blocks, protocol_versions, block_lanes
+    known = load_topology()
+    if not known:
+        return
+    start = time.monotonic()
+    lane_by_port = {lane.port: lane for lane in lanes}
+    block_lanes = {block_id: lane_by_port.get(info.get("port")) or lane_of(block_id)
+                   for block_id, info in known.items()}
+    found_on = {}
+    versions = {}
+    checks = await on_lanes(
+        'startup_check',
+        lambda ser, decoder, block_ids: check_known_blocks(
+            ser, decoder, {block_id: known[block_id].get("protocol", 1) for block_id in block_ids}),
+        sorted(known))
+    for (lane, _), lane_versions in zip(group_by_lane(sorted(known)), checks):
+        for block_id, version in lane_versions.items():
+            found_on[block_id] = lane
+            versions[block_id] = version
+    active_blocks = sorted(found_on)
+    protocol_versions = versions
+    block_lanes = found_on
+    missing = sorted(b for b in known if b not in found_on)
+    if not missing:
+        save_topology()  # protocol versions may have changed; a missing block keeps its entry until /ping
+    print(f"Cached topology: {len(active_blocks)} blocks ready in {(time.monotonic() - start) * 1000:.1f} ms"
+          + (f", not answering: {missing}" if missing else ""))
+
+
 @app.get('/rt_report')
-def get_reports():
+async def get_reports():
+    """Collect every active block's report from one broadcast; blocks that miss their slot are asked again by unicast."""
     global active_blocks
     results = []
-    with open_rs485() as ser:
-        if not active_blocks:
-            return 'No Active Blocks'
-        for block_id in active_blocks:
-            pkt = bld.build_send_report_packet(block_id)
-            ser_write(ser, pkt)
-            response = read_response(ser, block_id, cmdc.CMD_SEND_RT_REPORT)
-            # response format [STX, BLOCK_ID, CMD_SEND_RT_REPORT, len(payload)], <<2 byte status code as part of payload>>) + payload
-            # in this case, payload is calculated_reaction.to_bytes(3, 'big') **in microseconds**
-            # status codes: CA (calculated), NG (no gun), NR (no reaction), ND (no data)
-            if response:
-                payload_len = response[3]
-                status_code = response[4:6].decode()
-                reaction = int.from_bytes(
-                    response[6:9], byteorder='big', signed=True) / 1_000_000
-                if status_code and status_code == 'CA':
-                    results.append({
-                        "block_id": block_id,
-                        "status": status_code,
-                        "reaction": reaction
-                    })
-                elif status_code and status_code != 'CA':
-                    results.append({
-                        "block_id": block_id,
-                        "status": status_code
-                    })
-                else:
-                    results.append({
-                        "block_id": block_id,
-                        "status": "invalid_response"
-                    })
-            else:
+    if not active_blocks:
+        return 'No Active Blocks'
+    reports, _ = await broadcast_on_lanes(
+        'rt_report', cmdc.CMD_SEND_RT_REPORT, bld.build_send_report_packet, priority=PRIORITY_URGENT)
+
+    for block_id in active_blocks:
+        payload = reports.get(block_id)
+        # payload format <<2 byte status code>> + calculated_reaction.to_bytes(3, 'big') **in microseconds**
+        # status codes: CA (calculated), NG (no gun), NR (no reaction), ND (no data)
+        if payload is not None:
+            status_code = payload[0:2].decode(errors='replace')
+            reaction = int.from_bytes(
+                payload[2:5], byteorder='big', signed=True) / 1_000_000
+            if status_code and status_code == 'CA':
                 results.append({
                     "block_id": block_id,
-                    "status": "no_response"
+                    "status": status_code,
+                    "reaction": reaction
                 })
-        return {"results": results}
-
-
-@app.post('/arm')
-def arm():
-    results = []
-    abort_pin.off()
-    with open_rs485() as ser:
-        if not active_blocks:
-            return 'No Active Blocks'
-        for block_id in active_blocks:
-            pkt = bld.build_arm_packet(block_id)
-            ser_write(ser, pkt)
-            response = read_response(ser, block_id, cmdc.CMD_ARM)
-            if response:
+            elif status_code and status_code != 'CA':
                 results.append({
                     "block_id": block_id,
-                    "status": "armed",
+                    "status": status_code
                 })
             else:
                 results.append({
                     "block_id": block_id,
-                    "status": "no_response"
+                    "status": "invalid_response"
                 })
+        else:
+            results.append({
+                "block_id": block_id,
+                "status": "no_response"
+            })
     return {"results": results}
 
 
+@app.post('/arm')
+async def arm():
+    abort_pin.off()
+    if not active_blocks:
+        return 'No Active Blocks'
+    acked, bitmap = await broadcast_on_lanes('arm', cmdc.CMD_ARM, bld.build_arm_packet)
+    return ack_results(acked, bitmap, "armed")
+
+
+def abort_dump_jobs():
+    """Stop every dump still on the bus, /dump's included; blocks in a new run don't answer CMD_DUMP."""
+    for job in [job for job, _ in dump_jobs.values()] + list(foreground_dumps):
+        if not job.done:
+            print(f"Dump job {job.id} ({job.trigger}) aborted by a new run")
+            job.abort()
+
+
 @app.post('/set')
-def set():
-    with open_rs485() as ser:
-        pkt = bld.build_set_packet()
-        ser_write(ser, pkt)
+async def set():
+    abort_dump_jobs()  # before queueing, so a dump step waiting on a reply lets go of the bus now
+    pkt = bld.build_set_packet()
+    await on_lanes('set', lambda ser, decoder, block_ids: ser_write(ser, pkt))  # every bus, so every block starts
+    if PREFETCH_AFTER_RUN:
+        start_prefetch()  # captures land in the background; /dump then finds them unchanged
 
 
 @app.get('/dump')
-def dump_blocks():
-    """Dump binary files from all blocks and save to host machine."""
+async def dump_blocks(force: bool = False):
+    """
+    Dump binary files from all blocks and save to host machine. Captures the
+    host already has from the same run are not transferred again unless
+    force=true.
+    """
 
-    results = dump_all_blocks()
+    results = await dump_all_blocks(force)
     if not (isinstance(results, list) and all(isinstance(r, dict) for r in results)):
         return {"results": [], "summary": {"note": "Invalid results"}}
+    return {"results": results, "summary": dump_summary(results)}
 
-    # Calculate summary statistics
-    successful_dumps = [r for r in results if r["status"] == "success"]
-    total_bytes = sum(r["bytes_received"] for r in results)
 
-    return {
-        "results": results,
-        "summary": {
-            "total_blocks": len(active_blocks),
-            "successful_dumps": len(successful_dumps),
-            "failed_dumps": len(results) - len(successful_dumps),
-            "total_bytes_received": total_bytes
-        }
-    }
+@app.post('/dump/jobs')
+async def create_dump_job(force: bool = False):
+    """
+    Start dumping all blocks in the background and return the job id at once;
+    poll GET /dump/jobs/{job_id} for progress and results.
+    """
+    job = start_dump_job(force)
+    if job is None:
+        return 'No Active Blocks'
+    return {"job_id": job.id, "blocks": job.block_ids}
+
+
+@app.get('/dump/jobs')
+async def list_dump_jobs():
+    return [job.status() for job, _ in dump_jobs.values()]
+
+
+@app.get('/dump/jobs/{job_id}')
+async def get_dump_job(job_id: str):
+    """Per-block progress and throughput; results (with file paths) and a summary once done."""
+    if job_id not in dump_jobs:
+        return JSONResponse(status_code=404, content={"detail": f"No dump job {job_id}"})
+    job, task = dump_jobs[job_id]
+    status = job.status()
+    if task.cancelled():
+        status.update(state="cancelled")
+    elif task.done() and task.exception() is not None:
+        status.update(state="failed", error=str(task.exception()))
+    elif job.done and job.written:
+        results = [dict(r, path=os.path.abspath(r["filename"]) if r["filename"] else None) for r in job.results]
+        status.update(results=results, summary=dump_summary(results))
+    return status
+
+
+@app.get('/status')
+async def get_status():
+    """
+    State, run id and capture health counters of every active block, from
+    one broadcast per bus with no retries, so it is cheap to poll. Blocks
+    inside a run don't listen and come back as no_response.
+    """
+    if not active_blocks:
+        return 'No Active Blocks'
+    statuses = {}
+    for lane_statuses in await on_lanes('status', poll_status, active_blocks):
+        statuses.update(lane_statuses)
+    running = prefetch_task is not None and not prefetch_task.done()  # still watching for the end of a run
+    results = []
+    for block_id in active_blocks:
+        if block_id in statuses:
+            results.append(dict({"block_id": block_id, "status": "ok", "bus": lane_of(block_id).name},
+                                **statuses[block_id]))
+        else:
+            result = {"block_id": block_id, "status": "no_response"}
+            if running:
+                result["state"] = "logging"
+            results.append(result)
+    return {"results": results}
+
+
+@app.get('/linktest')
+async def linktest(count: int = Query(LINKTEST_COUNT, ge=1, le=LINKTEST_MAX_COUNT),
+                   size: int = Query(LINKTEST_SIZE, ge=1, le=LINKTEST_MAX_SIZE)):
+    """
+    Qualify the cabling: count echoes of size bytes per block, every bus at
+    once. Reports RTT percentiles, goodput and the frame error rate per block
+    and per bus.
+    """
+    if not active_blocks:
+        return 'No Active Blocks'
+    parts = [(lane, LinkTestJob(ids, count, size)) for lane, ids in group_by_lane(active_blocks)]
+    await asyncio.gather(*(lane.scheduler.submit(job, PRIORITY_BULK) for lane, job in parts))
+    results, buses = [], []
+    for lane, job in parts:
+        lane_results = [dict(r, bus=lane.name) for r in job.result]
+        results += lane_results
+        sent = sum(r["echoes"] for r in lane_results)
+        received = sum(r["bytes_received"] for r in lane_results)
+        bus_s = sum(r["bus_s"] for r in lane_results)
+        buses.append({
+            "bus": lane.name,
+            "port": lane.port,
+            "baud": BAUD,
+            "frame_error_rate": round(sum(r["lost"] + r["corrupt"] for r in lane_results) / sent, 4) if sent else None,
+            "goodput_kbps": round(received / bus_s / 1024, 1) if bus_s else 0.0,
+        })
+    return {"results": sorted(results, key=lambda r: r["block_id"]), "buses": buses}
+
+
+@app.get('/bus')
+async def bus_stats():
+    """Connection, per-transaction and scheduler statistics for each RS485 bus."""
+    return {"buses": [lane.snapshot() for lane in lanes], "rtt": rtt.snapshot(),
+            "recorder": bus_recorder.snapshot() if bus_recorder is not None else None}
+
+
+@app.post('/bus/capture')
+def save_bus_capture(clear: bool = False):
+    """Flush the recorded bus traffic to a pcap file for replay_capture.py."""
+    if bus_recorder is None:
+        return JSONResponse(status_code=404, content={"detail": "Bus recording is off (RECORDER_BYTES = 0)"})
+    path = os.path.abspath(time.strftime('bus_capture_%Y%m%d_%H%M%S.pcap'))
+    records = bus_recorder.dump(path)
+    stats = bus_recorder.snapshot()
+    if clear:
+        bus_recorder.clear()
+    return {"path": path, "records": records, "dropped": stats["dropped"],
+            "channels": {i: lane.name for i, lane in enumerate(lanes)}}
 
 
 @app.post('/abort')
 def abort_run():
+    # GPIO line, not a bus command: takes effect immediately even mid-dump
     abort_pin.on()
 
 
 @app.post('/set_gender/{gender}')
-def set_gender(gender: Literal['M', 'F']):
-    results = []
-    with open_rs485() as ser:
-        if not active_blocks:
-            return 'No Active Blocks'
-        for block_id in active_blocks:
-            pkt = bld.build_gender_packet(block_id, gender)
-            ser_write(ser, pkt)
-            response = read_response(ser, block_id, cmdc.CMD_SET_GENDER)
-            if response:
-                results.append({
-                    "block_id": block_id,
-                    "status": "ok"
-                })
-            else:
-                results.append({
-                    "block_id": block_id,
-                    "status": "no_response"
-                })
-    return {"results": results}
+async def set_gender(gender: Literal['M', 'F']):
+    if not active_blocks:
+        return 'No Active Blocks'
+    acked, bitmap = await broadcast_on_lanes(
+        'set_gender', cmdc.CMD_SET_GENDER, lambda block_id: bld.build_gender_packet(block_id, gender))
+    return ack_results(acked, bitmap, "ok")
+
+
+@app.post('/set_sensor/{sensor_type}')
+async def set_sensor(sensor_type: Literal['NC', 'NO']):
+    if not active_blocks:
+        return 'No Active Blocks'
+    acked, bitmap = await broadcast_on_lanes(
+        'set_sensor', cmdc.CMD_SET_SENSOR, lambda block_id: bld.build_sensor_type_packet(block_id, sensor_type))
+    return ack_results(acked, bitmap, "ok")
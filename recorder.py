@@ -0,0 +1,129 @@
+"""
+Bus traffic recorder: every byte the host writes to or reads from an RS485
+port, with monotonic timestamps, in a ring buffer bounded by size.
+
+Recording costs one deque append per serial read or write; nothing is
+formatted on the bus thread. dump() writes the buffer as a pcap file
+(nanosecond timestamps, LINKTYPE_USER0) that replay_capture.py feeds back
+through the host decoder. Each packet's data is the direction byte, the bus
+channel byte and the raw bytes of that read or write, so a received frame can
+span several packets, as it did on the wire.
+"""
+import collections
+import struct
+import threading
+import time
+
+TX = 0  # host -> blocks
+RX = 1  # blocks -> host
+
+PCAP_MAGIC_NS = 0xA1B23C4D  # pcap with nanosecond timestamps
+PCAP_LINKTYPE = 147  # LINKTYPE_USER0
+PCAP_HEADER_FMT = '<IHHiIII'  # magic, version major/minor, thiszone, sigfigs, snaplen, linktype
+PCAP_RECORD_FMT = '<IIII'  # seconds, nanoseconds, captured length, original length
+PCAP_RECORD_LEN = struct.calcsize(PCAP_RECORD_FMT)
+PCAP_SNAPLEN = 65535
+RECORD_PREFIX_LEN = 2  # direction, channel
+
+
+class FrameRecorder:
+    """
+    Ring buffer of (monotonic ns, direction, channel, bytes), dropping the
+    oldest records once they hold more than max_bytes of data.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._records = collections.deque()
+        self._bytes = 0
+        self._lock = threading.Lock()  # one bus thread per lane records here
+        self.dropped = 0  # records pushed out of the ring
+        # monotonic -> wall clock, for the pcap timestamps
+        self._wall_offset_ns = time.time_ns() - time.monotonic_ns()
+
+    def add(self, direction: int, channel: int, data: bytes):
+        with self._lock:
+            self._records.append((time.monotonic_ns(), direction, channel, data))
+            self._bytes += len(data)
+            while self._bytes > self.max_bytes and len(self._records) > 1:
+                self._bytes -= len(self._records.popleft()[3])
+                self.dropped += 1
+
+    def tap(self, ser, channel: int = 0):
+        """Wrap an open serial port so its traffic is recorded under channel."""
+        return TappedSerial(ser, self, channel)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {"records": len(self._records), "bytes": self._bytes,
+                    "max_bytes": self.max_bytes, "dropped": self.dropped}
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
+            self._bytes = 0
+
+    def dump(self, path: str) -> int:
+        """Write the buffered records to path as a pcap file. Returns the number written."""
+        with self._lock:
+            records = list(self._records)
+        with open(path, 'wb') as f:
+            f.write(struct.pack(PCAP_HEADER_FMT, PCAP_MAGIC_NS, 2, 4, 0, 0, PCAP_SNAPLEN, PCAP_LINKTYPE))
+            for t_ns, direction, channel, data in records:
+                wall_ns = t_ns + self._wall_offset_ns
+                # a pcap record holds at most PCAP_SNAPLEN bytes; split longer reads
+                for start in range(0, len(data), PCAP_SNAPLEN - RECORD_PREFIX_LEN):
+                    part = data[start:start + PCAP_SNAPLEN - RECORD_PREFIX_LEN]
+                    length = RECORD_PREFIX_LEN + len(part)
+                    f.write(struct.pack(PCAP_RECORD_FMT, wall_ns // 1_000_000_000, wall_ns % 1_000_000_000,
+                                        length, length))
+                    f.write(bytes((direction, channel)))
+                    f.write(part)
+        return len(records)
+
+
+class TappedSerial:
+    """
+    A serial port that hands every write and every non-empty read to a
+    FrameRecorder. Everything else, baudrate changes included, goes straight
+    to the wrapped port.
+    """
+
+    def __init__(self, ser, recorder: FrameRecorder, channel: int):
+        object.__setattr__(self, '_ser', ser)
+        object.__setattr__(self, '_recorder', recorder)
+        object.__setattr__(self, '_channel', channel)
+
+    def write(self, data):
+        self._recorder.add(TX, self._channel, bytes(data))
+        return self._ser.write(data)
+
+    def read(self, size: int = 1) -> bytes:
+        data = self._ser.read(size)
+        if data:
+            self._recorder.add(RX, self._channel, data)
+        return data
+
+    def __getattr__(self, name):
+        return getattr(self._ser, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._ser, name, value)
+
+
+def read_capture(path: str):
+    """Yield (wall clock ns, direction, channel, data) for every record in a pcap from FrameRecorder.dump()."""
+    with open(path, 'rb') as f:
+        header = f.read(struct.calcsize(PCAP_HEADER_FMT))
+        magic, _, _, _, _, _, linktype = struct.unpack(PCAP_HEADER_FMT, header)
+        if magic != PCAP_MAGIC_NS or linktype != PCAP_LINKTYPE:
+            raise ValueError(f"{path} is not a bus capture (magic 0x{magic:08X}, linktype {linktype})")
+        while True:
+            record = f.read(PCAP_RECORD_LEN)
+            if len(record) < PCAP_RECORD_LEN:
+                return
+            seconds, nanoseconds, length, _ = struct.unpack(PCAP_RECORD_FMT, record)
+            data = f.read(length)
+            if len(data) < length or length < RECORD_PREFIX_LEN:
+                return  # truncated at the end
+            yield seconds * 1_000_000_000 + nanoseconds, data[0], data[1], data[RECORD_PREFIX_LEN:]
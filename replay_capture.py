@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Replay a bus capture from POST /bus/capture through the host frame decoder.
+
+Feeds every recorded read and write back in its original sizes, one decoder
+per bus and direction, and counts frames per command, bad checksums and
+skipped bytes, e.g.
+
+    python replay_capture.py bus_capture_20260101_120000.pcap
+    python replay_capture.py capture.pcap --frames            # every decoded frame
+    python replay_capture.py capture.pcap --frames --channel 1
+    python replay_capture.py capture.pcap --bench 20          # decoder throughput
+"""
+import argparse
+import collections
+import time
+import codec
+import command_codes as cmdc
+from recorder import TX, RX, read_capture
+
+DIRECTIONS = {TX: 'TX', RX: 'RX'}
+CMD_NAMES = {value: name for name, value in vars(cmdc).items()
+             if name.startswith('CMD_') and isinstance(value, int)}
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument('capture', help='pcap file written by POST /bus/capture')
+    p.add_argument('--frames', action='store_true', help='print every decoded frame')
+    p.add_argument('--channel', type=int, default=None, help='only this bus (the lane index)')
+    p.add_argument('--payload-bytes', type=int, default=16, help='payload bytes shown per frame with --frames')
+    p.add_argument('--bench', type=int, default=0, metavar='N',
+                   help='feed the received bytes through a fresh decoder N times and report throughput')
+    return p.parse_args()
+
+
+def cmd_name(cmd: int) -> str:
+    if cmd in CMD_NAMES:
+        return CMD_NAMES[cmd]
+    if cmd & 0x40 and cmd & ~0x40 in CMD_NAMES:
+        return CMD_NAMES[cmd & ~0x40] + '|reply'
+    return f'0x{cmd:02X}'
+
+
+def replay(records, show_frames: bool, payload_bytes: int) -> dict:
+    """Decode records; returns {(channel, direction): stats}."""
+    decoders = {}
+    stats = {}
+    first_ns = records[0][0] if records else 0
+    for t_ns, direction, channel, data in records:
+        key = (channel, direction)
+        if key not in decoders:
+            decoders[key] = codec.FrameDecoder()
+            stats[key] = {"records": 0, "bytes": 0, "commands": collections.Counter()}
+        decoder, s = decoders[key], stats[key]
+        s["records"] += 1
+        s["bytes"] += len(data)
+        decoder.feed(data)
+        for block_id, cmd, payload in decoder.frames():
+            s["commands"][cmd_name(cmd)] += 1
+            if show_frames:
+                block = 'all' if block_id == cmdc.BROADCAST_ID else block_id
+                print(f"{(t_ns - first_ns) / 1e6:>12.3f} ms  bus {channel} {DIRECTIONS.get(direction, direction)} "
+                      f"v{decoder.version} block {block:>3} {cmd_name(cmd):<24} len {len(payload):>5}  "
+                      f"{payload[:payload_bytes].hex(' ')}{' ...' if len(payload) > payload_bytes else ''}")
+    for key, decoder in decoders.items():
+        stats[key].update(frames=decoder.frames_ok, bad_checksums=decoder.bad_checksums,
+                          skipped_bytes=decoder.skipped_bytes, leftover_bytes=decoder.pending())
+    return stats
+
+
+def bench(records, rounds: int):
+    """Decoder throughput over the received bytes, read by read as the host saw them."""
+    reads = {}
+    for _, direction, channel, data in records:
+        if direction == RX:
+            reads.setdefault(channel, []).append(data)
+    for channel, chunks in sorted(reads.items()):
+        total = sum(len(c) for c in chunks)
+        durations = []
+        frames = 0
+        for _ in range(rounds):
+            decoder = codec.FrameDecoder()
+            start = time.perf_counter()
+            for chunk in chunks:
+                decoder.feed(chunk)
+                for _ in decoder.frames():
+                    pass
+            durations.append(time.perf_counter() - start)
+            frames = decoder.frames_ok
+        best = min(durations)
+        print(f"bus {channel} RX: {total} bytes, {frames} frames in {len(chunks)} reads: best {best * 1000:.2f} ms "
+              f"= {total / best / 1e6:.1f} MB/s, {frames / best:.0f} frames/s")
+
+
+def main():
+    args = parse_args()
+    records = [r for r in read_capture(args.capture) if args.channel is None or r[2] == args.channel]
+    if not records:
+        print("no records")
+        return
+    span = (records[-1][0] - records[0][0]) / 1e9
+    print(f"{len(records)} records over {span:.3f} s")
+
+    stats = replay(records, args.frames, args.payload_bytes)
+    for (channel, direction), s in sorted(stats.items()):
+        print(f"\nbus {channel} {DIRECTIONS.get(direction, direction)}: {s['bytes']} bytes in {s['records']} records, "
+              f"{s['frames']} frames, {s['bad_checksums']} bad checksums, {s['skipped_bytes']} skipped bytes, "
+              f"{s['leftover_bytes']} left undecoded")
+        for name, count in s["commands"].most_common():
+            print(f"    {name:<28} {count:>8}")
+
+    if args.bench:
+        print()
+        bench(records, args.bench)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+"""
+Async scheduler that owns the RS485 bus.
+
+Every bus exchange is queued here and run one at a time on a single bus
+thread, so concurrent requests can never interleave bytes on the half-duplex
+bus and endpoints never tie up a worker thread while they wait. Lower priority
+numbers run first. Long jobs are split into steps; between steps the job goes
+back in the queue, so more urgent work that arrived meanwhile cuts in at the
+step boundary.
+"""
+import asyncio
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+from bus import RS485Bus
+
+PRIORITY_URGENT = 0  # results the operator is waiting on, e.g. /rt_report
+PRIORITY_CONTROL = 1  # ping, arm, set and configuration
+PRIORITY_BULK = 2  # dumps
+
+
+class CallJob:
+    """One bus transaction: fn(ser, decoder) -> result."""
+
+    def __init__(self, name: str, fn):
+        self.name = name
+        self._fn = fn
+        self.done = False
+        self.result = None
+
+    def step(self, ser, decoder):
+        self.result = self._fn(ser, decoder)
+        self.done = True
+
+
+class StepJob:
+    """
+    A job made of independent bus steps, each fn(ser, decoder) -> item.
+    The result is finish([item, ...]), or the list itself without finish.
+    """
+
+    def __init__(self, name: str, steps, finish=None):
+        self.name = name
+        self._steps = list(steps)
+        self._finish = finish
+        self.items = []
+        self.done = not self._steps
+        self.result = self._finalize() if self.done else None
+
+    def step(self, ser, decoder):
+        self.items.append(self._steps[len(self.items)](ser, decoder))
+        if len(self.items) == len(self._steps):
+            self.result = self._finalize()
+            self.done = True
+
+    def _finalize(self):
+        return self._finish(self.items) if self._finish else self.items
+
+
+class BusScheduler:
+    """
+    Priority queue of bus jobs, drained by one worker task.
+
+    A job is any object with a `name`, a `done` flag, a `result` and a
+    `step(ser, decoder)` method that performs the next unit of bus work.
+    A job that leaves the bus changed between its steps (e.g. a dump at a
+    raised baud rate) also has `release(ser, decoder)`, called before any
+    other job gets the bus.
+    """
+
+    def __init__(self, bus: RS485Bus):
+        self.bus = bus
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f'{bus.name}-bus')
+        self._seq = itertools.count()
+        self._queue = None
+        self._worker = None
+        self._holder = None  # unfinished job that changed the bus and must release it
+        self.stats = {"jobs": 0, "steps": 0, "preemptions": 0, "max_queue_depth": 0}
+
+    def start(self):
+        """Start the worker on the running event loop (idempotent)."""
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.PriorityQueue()
+            self._worker = asyncio.create_task(self._run(), name=f'{self.bus.name}-scheduler')
+
+    async def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+    async def submit(self, job, priority: int = PRIORITY_CONTROL):
+        """Queue a job and wait for its result."""
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        self.stats["jobs"] += 1
+        await self._queue.put((priority, next(self._seq), job, future))
+        self.stats["max_queue_depth"] = max(self.stats["max_queue_depth"], self._queue.qsize())
+        return await future
+
+    async def run(self, name: str, fn, priority: int = PRIORITY_CONTROL):
+        """Run fn(ser, decoder) as one bus transaction and return its result."""
+        return await self.submit(CallJob(name, fn), priority)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        requeued = None  # (priority, job) put back at the last step boundary
+        while True:
+            priority, seq, job, future = await self._queue.get()
+            if requeued is not None and job is not requeued[1] and priority < requeued[0]:
+                self.stats["preemptions"] += 1  # something more urgent went before the requeued job
+            requeued = None
+            if future.done():
+                continue  # caller went away before we got to it
+            try:
+                try:
+                    await loop.run_in_executor(self._executor, self._step, job)
+                except Exception as e:
+                    if not future.done():  # the caller may have been cancelled mid-step
+                        future.set_exception(e)
+                    continue
+                if future.done():
+                    continue
+                if job.done:
+                    future.set_result(job.result)
+                    continue
+                # Step boundary: requeue with the original sequence number, so the
+                # job keeps its place among equals but anything more urgent goes first.
+                self._queue.put_nowait((priority, seq, job, future))
+                requeued = (priority, job)
+            except Exception as e:
+                # one job must never take the worker, and every job queued behind it, down
+                print(f"{self.bus.name} scheduler: job {job.name} failed: {e!r}")
+                if not future.done():
+                    future.set_exception(e)
+
+    def _step(self, job):
+        with self.bus.transaction(job.name) as (ser, decoder):
+            if self._holder is not None and self._holder is not job:
+                holder, self._holder = self._holder, None
+                holder.release(ser, decoder)
+            job.step(ser, decoder)
+            if hasattr(job, 'release'):
+                self._holder = None if job.done else job
+        self.stats["steps"] += 1
+
+    def snapshot(self) -> dict:
+        return dict(self.stats, queued=self._queue.qsize() if self._queue else 0)
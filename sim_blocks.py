@@ -0,0 +1,378 @@
+"""
+Simulated RS485 block farm.
+
+Stands in for up to 10 blocks on a pty pair so the host in main.py can run
+/ping, /arm, /rt_report and /dump with no Pi or RP2040 attached. The farm
+speaks the same v1 and v2 framing as block/main.py and paces its replies at
+the configured baud rate; REACT_SIM_PROTOCOL=1 makes it behave like firmware
+that only knows v1, and REACT_SIM_PROTOCOL=0 like the original firmware: raw,
+unsequenced 255-byte dump chunks with no CMD_DUMP_INFO, nothing newer than
+CMD_SEND_RT_REPORT, and no replies to broadcasts (discover those blocks with
+/ping?sweep=true). REACT_SIM_BUSES splits the blocks over that many farms,
+one pty each, like blocks wired to separate UARTs.
+
+CMD_BAUD moves a block to another rate. The farm reads the host's rate off
+the pty, so frames only get through when both ends agree; anything else
+arrives as noise. REACT_SIM_MAX_BAUD garbles every frame above that rate,
+like transceivers driven past their rating.
+
+Set REACT_SIM=1 before starting the API to use it, e.g.
+
+    REACT_SIM=1 REACT_SIM_BLOCKS=10 poetry run poe api
+    REACT_SIM=1 REACT_SIM_BLOCKS=10 REACT_SIM_BUSES=2 poetry run poe api
+"""
+import os
+import random
+import select
+import struct
+import termios
+import threading
+import time
+import tty
+import zlib
+import codec
+import command_codes as cmdc
+import builders as bld
+
+
+BITS_PER_BYTE = 10  # start + 8 data + stop
+BYTES_PER_SAMP = 16
+DEFAULT_DUMP_BYTES = 5 * 2048 * BYTES_PER_SAMP  # 5 s at 2 kHz, as in fifo_comms
+FIRMWARE_SEND_DELAY_US = 250  # time.sleep_us(250) in block/main.py tx_begin()
+LEGACY_CHUNK_SIZE = 255  # dump() chunks of firmware before sequence numbers
+LEGACY_COMMANDS = (cmdc.CMD_PING, cmdc.CMD_ARM, cmdc.CMD_SET, cmdc.CMD_DUMP, cmdc.CMD_SET_SENSOR,
+                   cmdc.CMD_SET_GENDER, cmdc.CMD_SEND_RT_REPORT)
+# termios speed constant -> baud, for reading the host's rate off the pty
+TERMIOS_RATES = {getattr(termios, f'B{rate}'): rate
+                 for rate in (9600, 19200, 38400, 57600, 115200, 230400, 460800, 500000, 576000,
+                              921600, 1000000, 1152000, 1500000, 2000000, 2500000, 3000000,
+                              3500000, 4000000)
+                 if hasattr(termios, f'B{rate}')}
+
+
+def make_capture(num_bytes: int, seed: int = 0) -> bytes:
+    """Build a fake overall_buffer.bin of 16-byte FIFO packets."""
+    rng = random.Random(seed)
+    samples = num_bytes // BYTES_PER_SAMP
+    out = bytearray(rng.randbytes(samples * BYTES_PER_SAMP))
+    for i in range(samples):
+        offset = i * BYTES_PER_SAMP
+        ts = (i * 16) & 0xFFFF
+        out[offset] = 0x68  # FIFO header
+        out[offset + 14] = ts >> 8
+        out[offset + 15] = ts & 0xFF
+    return bytes(out)
+
+
+class SimBlock:
+    """State and command handlers of one simulated block (mirrors block/main.py)."""
+
+    def __init__(self, block_id: int, dump_bytes: int = DEFAULT_DUMP_BYTES,
+                 protocol_version: int = cmdc.PROTOCOL_VERSION, baud: int = 1500000):
+        self.block_id = block_id
+        self.base_baud = baud
+        self.rate = baud  # UART rate; CMD_BAUD changes it once its ack is out
+        self.next_rate = None
+        self.revert_s = 0.0
+        self.last_rx = time.monotonic()
+        self.protocol_version = protocol_version  # 1 behaves like firmware before CMD_PROTOCOL, 0 like the original
+        self.version = 1  # frame version of the request being answered
+        self.gun_sensor_type = 'NC'
+        self.current_gender = None
+        self.gun_timestamp = None
+        self.rt_timestamp = None
+        self.dump_bytes = dump_bytes
+        self.run_id = 0
+        self.state = cmdc.STATE_IDLE
+        self.capture = make_capture(dump_bytes, seed=block_id)
+        self.busy_until = 0.0
+        self.rng = random.Random(block_id)
+
+    def handle(self, cmd: int, payload: bytes, is_broadcast: bool, run_s: float, version: int = 1) -> list[bytes]:
+        """Return the reply frames the firmware would send for one command, as one burst."""
+        if time.monotonic() < self.busy_until:
+            return []  # still inside start_loop(), not listening
+        if version > max(1, self.protocol_version):
+            return []  # old firmware doesn't recognise the frame at all
+        self.version = version
+        self.last_rx = time.monotonic()
+        if self.protocol_version < 1 and (cmd not in LEGACY_COMMANDS or (is_broadcast and cmd != cmdc.CMD_SET)):
+            return []  # the original firmware: seven commands, no replies to broadcasts
+        if cmd == cmdc.CMD_PING:
+            return [self.ack(cmdc.CMD_PING)]
+        elif cmd == cmdc.CMD_ARM:
+            self.state = cmdc.STATE_ARMED
+            return [self.ack(cmdc.CMD_ARM)]
+        elif cmd == cmdc.CMD_SET:
+            self.run(run_s)
+        elif cmd == cmdc.CMD_DUMP and self.protocol_version < 1:
+            return self.legacy_dump_frames()
+        elif cmd == cmdc.CMD_DUMP:
+            window = struct.unpack_from(cmdc.DUMP_WINDOW_FMT, payload)[0] if len(payload) >= 2 else None
+            if len(payload) >= cmdc.DUMP_WINDOW_LEN + cmdc.DUMP_TAG_LEN:
+                known = struct.unpack_from(cmdc.DUMP_TAG_FMT, payload, cmdc.DUMP_WINDOW_LEN)
+                if known == self.tag():
+                    return [self.frame(cmdc.reply_cmd(cmdc.CMD_DUMP_UNCHANGED), struct.pack(cmdc.DUMP_TAG_FMT, *known))]
+            return self.dump_frames(window or None)
+        elif cmd == cmdc.CMD_SET_SENSOR:
+            s = payload.decode(errors='replace').strip()
+            if s in ('NC', 'NO'):
+                self.gun_sensor_type = s
+                return [self.ack(cmdc.CMD_SET_SENSOR)]
+        elif cmd == cmdc.CMD_SET_GENDER:
+            s = payload.decode(errors='replace').strip()
+            if s in ('M', 'F'):
+                self.current_gender = s
+                return [self.ack(cmdc.CMD_SET_GENDER)]
+        elif cmd == cmdc.CMD_SEND_RT_REPORT:
+            return [self.rt_report()]
+        elif cmd == cmdc.CMD_DUMP_RESEND and not is_broadcast:
+            return self.resend_frames(payload)
+        elif cmd == cmdc.CMD_DUMP_ACK and not is_broadcast and len(payload) == cmdc.DUMP_ACK_LEN:
+            next_seq, window = struct.unpack(cmdc.DUMP_ACK_FMT, payload)
+            return self.window_frames(next_seq, window)
+        elif cmd == cmdc.CMD_PROTOCOL and self.protocol_version >= 2:
+            return [self.frame(cmdc.reply_cmd(cmdc.CMD_PROTOCOL), bytes([self.protocol_version]))]
+        elif cmd == cmdc.CMD_BAUD and not is_broadcast and len(payload) == cmdc.BAUD_LEN:
+            rate, revert_ms = struct.unpack(cmdc.BAUD_FMT, payload)
+            self.next_rate = rate or self.base_baud
+            self.revert_s = revert_ms / 1000
+            return [self.ack(cmdc.CMD_BAUD)]
+        elif cmd == cmdc.CMD_ECHO and not is_broadcast and len(payload) >= cmdc.ECHO_LEN:
+            seq, size = struct.unpack_from(cmdc.ECHO_FMT, payload)
+            size = min(size, cmdc.max_payload(version) - cmdc.ECHO_REPLY_LEN)
+            reply = struct.pack(cmdc.ECHO_REPLY_FMT, seq) + codec.echo_pattern(seq, size)
+            return [self.frame(cmdc.reply_cmd(cmdc.CMD_ECHO), reply)]
+        elif cmd == cmdc.CMD_STATUS:
+            return [self.status()]
+        return []
+
+    def status(self) -> bytes:
+        """handle_status(): always a v1 frame, counters made up from the capture."""
+        samples = len(self.capture) // BYTES_PER_SAMP
+        payload = struct.pack(cmdc.STATUS_FMT, self.state, self.run_id, samples, samples // 32,
+                              0, samples // 0x10000, 150_000, len(self.capture))
+        return bld.build_frame(self.block_id, cmdc.reply_cmd(cmdc.CMD_STATUS), payload)
+
+    def check_revert(self):
+        """check_baud_revert(): back to the base rate after revert_s without a valid frame."""
+        if self.rate != self.base_baud and time.monotonic() - self.last_rx > self.revert_s:
+            self.rate = self.base_baud
+
+    def frame(self, cmd: int, payload: bytes = b'') -> bytes:
+        return bld.build_frame(self.block_id, cmd, payload, self.version)
+
+    def ack(self, cmd: int) -> bytes:
+        return self.frame(cmdc.reply_cmd(cmd))
+
+    def run(self, run_s: float):
+        # gun somewhere in the run, runner reacts 100-250 ms later
+        self.gun_timestamp = self.rng.randrange(0, 0x10000)
+        self.rt_timestamp = self.gun_timestamp + self.rng.randrange(3277, 8192)
+        self.busy_until = time.monotonic() + run_s
+        self.state = cmdc.STATE_FINISHED  # only visible once busy_until has passed
+        self.run_id += 1
+        self.capture = make_capture(self.dump_bytes, seed=self.block_id + 1000 * self.run_id)
+
+    def tag(self) -> tuple[int, int]:
+        return self.run_id, zlib.crc32(self.capture)
+
+    def rt_report(self) -> bytes:
+        reply = cmdc.reply_cmd(cmdc.CMD_SEND_RT_REPORT)
+        if self.rt_timestamp is not None and self.gun_timestamp is not None:
+            reaction = int((self.rt_timestamp - self.gun_timestamp) * 0.000030517578125 * 1_000_000)
+            return self.frame(reply, b'CA' + reaction.to_bytes(3, 'big'))
+        if self.rt_timestamp is not None:
+            return self.frame(reply, b'NG')
+        if self.gun_timestamp is not None:
+            return self.frame(reply, b'NR')
+        return self.frame(reply, b'ND')
+
+    def dump_frames(self, window: int | None = None) -> list[bytes]:
+        info = struct.pack(cmdc.DUMP_INFO_FMT, len(self.capture), self.chunk_size())
+        info += struct.pack(cmdc.DUMP_TAG_FMT, *self.tag())
+        info += struct.pack(cmdc.DUMP_RUN_FMT, self.chunk_count(), self.gun_timestamp or 0, self.rt_timestamp or 0)
+        frames = [self.frame(cmdc.reply_cmd(cmdc.CMD_DUMP_INFO), info)]
+        return frames + self.window_frames(0, window or self.chunk_count())
+
+    def legacy_dump_frames(self) -> list[bytes]:
+        """The original dump(): raw 255-byte chunks, no seq and no CMD_DUMP_INFO, then the empty CMD_DUMP reply."""
+        reply = cmdc.reply_cmd(cmdc.CMD_DUMP)
+        frames = [self.frame(reply, self.capture[offset:offset + LEGACY_CHUNK_SIZE])
+                  for offset in range(0, len(self.capture), LEGACY_CHUNK_SIZE)]
+        return frames + [self.ack(cmdc.CMD_DUMP)]
+
+    def window_frames(self, first_seq: int, count: int) -> list[bytes]:
+        """send_window(): the chunks, then the CMD_DUMP_ACK reply, or CMD_DUMP after the last chunk."""
+        last = first_seq + count >= self.chunk_count()
+        return self.chunk_frames(first_seq, count) + [self.ack(cmdc.CMD_DUMP if last else cmdc.CMD_DUMP_ACK)]
+
+    def chunk_size(self) -> int:
+        return cmdc.dump_chunk_size(self.version)
+
+    def chunk_count(self) -> int:
+        return (len(self.capture) + self.chunk_size() - 1) // self.chunk_size()
+
+    def chunk_frames(self, first_seq: int, count: int) -> list[bytes]:
+        reply = cmdc.reply_cmd(cmdc.CMD_DUMP)
+        frames = []
+        chunk_size = self.chunk_size()
+        for seq in range(first_seq, min(first_seq + count, self.chunk_count())):
+            offset = seq * chunk_size
+            chunk = self.capture[offset:offset + chunk_size]
+            frames.append(self.frame(reply, struct.pack(cmdc.DUMP_SEQ_FMT, seq) + chunk))
+        return frames
+
+    def resend_frames(self, payload: bytes) -> list[bytes]:
+        frames = []
+        for i in range(0, len(payload) - cmdc.DUMP_RANGE_LEN + 1, cmdc.DUMP_RANGE_LEN):
+            first_seq, count = struct.unpack_from(cmdc.DUMP_RANGE_FMT, payload, i)
+            frames += self.chunk_frames(first_seq, count)
+        return frames + [self.ack(cmdc.CMD_DUMP_RESEND)]
+
+
+class SimFarm:
+    """
+    A set of SimBlocks sharing one simulated half-duplex bus.
+
+    The host opens `port` (the pty slave) like a real serial device. Each reply
+    burst is written after one turnaround delay, frames back to back, paced at
+    `baud`; error_rate flips one bit in that fraction of the frames.
+    """
+
+    def __init__(self, block_ids=range(1, 11), baud: int = 1500000,
+                 turnaround_us: int = FIRMWARE_SEND_DELAY_US,
+                 dump_bytes: int = DEFAULT_DUMP_BYTES, run_s: float = 0.0,
+                 error_rate: float = 0.0, protocol_version: int = cmdc.PROTOCOL_VERSION,
+                 max_baud: int = 0):
+        self.blocks = {bid: SimBlock(bid, dump_bytes, protocol_version, baud) for bid in block_ids}
+        self.baud = baud
+        self.max_baud = max_baud  # frames at a higher rate are garbled; 0 for no limit
+        self.turnaround_us = turnaround_us
+        self.run_s = run_s
+        self.error_rate = error_rate  # fraction of reply frames with one corrupted byte
+        self.stats = {"rx_frames": 0, "tx_frames": 0, "rx_bytes": 0, "tx_bytes": 0, "corrupted_frames": 0,
+                      "garbled_frames": 0}
+        self._rng = random.Random(0)
+        self._master_fd, self._slave_fd = os.openpty()
+        tty.setraw(self._slave_fd)
+        self.port = os.ttyname(self._slave_fd)
+        self._decoder = codec.FrameDecoder()
+        self._bus_free_at = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    @classmethod
+    def from_env(cls, baud: int = 1500000, block_ids=None) -> 'SimFarm':
+        """Configure from REACT_SIM_* environment variables; block_ids overrides REACT_SIM_BLOCKS."""
+        if block_ids is None:
+            block_ids = range(1, int(os.environ.get('REACT_SIM_BLOCKS', '10')) + 1)
+        return cls(
+            block_ids=block_ids,
+            baud=int(os.environ.get('REACT_SIM_BAUD', str(baud))),
+            turnaround_us=int(os.environ.get('REACT_SIM_TURNAROUND_US', str(FIRMWARE_SEND_DELAY_US))),
+            dump_bytes=int(os.environ.get('REACT_SIM_DUMP_BYTES', str(DEFAULT_DUMP_BYTES))),
+            run_s=float(os.environ.get('REACT_SIM_RUN_S', '0')),
+            error_rate=float(os.environ.get('REACT_SIM_ERROR_RATE', '0')),
+            protocol_version=int(os.environ.get('REACT_SIM_PROTOCOL', str(cmdc.PROTOCOL_VERSION))),
+            max_baud=int(os.environ.get('REACT_SIM_MAX_BAUD', '0')),
+        )
+
+    def start(self):
+        self._thread = threading.Thread(target=self._serve, name=f'sim-blocks-{min(self.blocks, default=0)}', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        os.close(self._master_fd)
+        os.close(self._slave_fd)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def wire_time(self, num_bytes: int, rate: int = 0) -> float:
+        return num_bytes * BITS_PER_BYTE / (rate or self.baud)
+
+    def host_rate(self) -> int:
+        """The rate the host has set on its end of the pty."""
+        return TERMIOS_RATES.get(termios.tcgetattr(self._slave_fd)[4], self.baud)
+
+    def _clean(self, block_rate: int, host_rate: int) -> bool:
+        """True if a frame between a block at block_rate and the host gets through."""
+        return block_rate == host_rate and not (self.max_baud and block_rate > self.max_baud)
+
+    def _serve(self):
+        while not self._stop.is_set():
+            ready, _, _ = select.select([self._master_fd], [], [], 0.05)
+            if not ready:
+                continue
+            data = os.read(self._master_fd, 4096)
+            now = time.perf_counter()
+            rate = self.host_rate()
+            self.stats["rx_bytes"] += len(data)
+            # the host's bytes occupy the bus before anyone can answer
+            self._bus_free_at = max(self._bus_free_at, now) + self.wire_time(len(data), rate)
+            self._decoder.feed(data)
+            for block_id, cmd, payload in self._decoder.frames():
+                self.stats["rx_frames"] += 1
+                self._dispatch(block_id, cmd, payload, self._bus_free_at, self._decoder.version, rate)
+
+    def _dispatch(self, block_id: int, cmd: int, payload: bytes, rx_at: float, version: int = 1, rate: int = 0):
+        is_broadcast = block_id == cmdc.BROADCAST_ID
+        targets = self.blocks.values() if is_broadcast else [self.blocks.get(block_id)]
+        for block in targets:
+            if block is None:
+                continue
+            block.check_revert()
+            if not self._clean(block.rate, rate or self.baud):
+                continue  # noise to this block's UART
+            not_before = rx_at
+            if is_broadcast:
+                # send_in_slot(): each block waits for its own slot after the request
+                not_before += (block.block_id - 1) * cmdc.BROADCAST_SLOT_US / 1_000_000
+            frames = block.handle(cmd, payload, is_broadcast, self.run_s, version)
+            if frames:
+                self._transmit(frames, not_before, block.rate)
+            if block.next_rate:
+                block.rate, block.next_rate = block.next_rate, None
+
+    def _transmit(self, frames: list[bytes], not_before: float = 0.0, rate: int = 0):
+        # firmware sleeps once before raising RTS, then each frame takes its wire time
+        self._bus_free_at = max(time.perf_counter(), self._bus_free_at, not_before) + self.turnaround_us / 1_000_000
+        self._sleep_until(self._bus_free_at)
+        clean = self._clean(rate or self.baud, self.host_rate())
+        for frame in frames:
+            if not clean:
+                frame = self._rng.randbytes(len(frame))  # what the host's UART makes of it
+                self.stats["garbled_frames"] += 1
+            elif self.error_rate and self._rng.random() < self.error_rate:
+                frame = bytearray(frame)
+                frame[self._rng.randrange(len(frame))] ^= 1 << self._rng.randrange(8)
+                self.stats["corrupted_frames"] += 1
+            # the host has the whole frame once its last byte is off the wire
+            self._bus_free_at += self.wire_time(len(frame), rate)
+            self._sleep_until(self._bus_free_at)
+            os.write(self._master_fd, frame)
+            self.stats["tx_frames"] += 1
+            self.stats["tx_bytes"] += len(frame)
+
+    @staticmethod
+    def _sleep_until(t: float):
+        delay = t - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+
+def farms_from_env(baud: int = 1500000) -> list[SimFarm]:
+    """REACT_SIM_BLOCKS blocks split into REACT_SIM_BUSES farms of consecutive IDs, not started."""
+    num_blocks = int(os.environ.get('REACT_SIM_BLOCKS', '10'))
+    num_buses = max(1, min(num_blocks, int(os.environ.get('REACT_SIM_BUSES', '1'))))
+    ids = list(range(1, num_blocks + 1))
+    per_bus = max(1, -(-num_blocks // num_buses))  # ceil
+    return [SimFarm.from_env(baud, ids[i:i + per_bus]) for i in range(0, num_blocks, per_bus)]
@@ -0,0 +1,55 @@
+"""
+Bus topology: which RS485 port each block is wired to.
+
+Every port is a Lane with its own RS485Bus and BusScheduler, so the buses run
+at the same time while each one stays strictly half-duplex on its own.
+"""
+from bus import RS485Bus
+from scheduler import BusScheduler
+
+
+def parse_block_ids(spec: str) -> list[int]:
+    """'1-5' or '1,2,7' or '1-3,8' -> sorted block IDs."""
+    ids = []
+    for part in spec.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if '-' in part:
+            first, last = part.split('-', 1)
+            ids.extend(range(int(first), int(last) + 1))
+        else:
+            ids.append(int(part))
+    return sorted(ids)
+
+
+def parse_topology(spec: str) -> dict[str, list[int]]:
+    """'/dev/ttyAMA0=1-5;/dev/ttyAMA1=6-10' -> {port: [block ids]}."""
+    topology = {}
+    for entry in spec.split(';'):
+        if not entry.strip():
+            continue
+        port, _, ids = entry.partition('=')
+        if not ids:
+            raise ValueError(f"topology entry {entry!r} should look like PORT=1-5")
+        topology[port.strip()] = parse_block_ids(ids)
+    return topology
+
+
+class Lane:
+    """One RS485 port: its bus, its scheduler and the block IDs expected on it."""
+
+    def __init__(self, name: str, port: str, block_ids, open_port, recorder=None, channel: int = 0):
+        """
+        open_port() must return a new, open serial.Serial-like object for port.
+        With a recorder.FrameRecorder, the bus traffic is recorded under channel.
+        """
+        self.name = name
+        self.port = port
+        self.block_ids = list(block_ids)
+        self.bus = RS485Bus(open_port, name, recorder, channel)
+        self.scheduler = BusScheduler(self.bus)
+
+    def snapshot(self) -> dict:
+        return dict(self.bus.snapshot(), port=self.port, block_ids=self.block_ids,
+                    scheduler=self.scheduler.snapshot())